@@ -0,0 +1,172 @@
+# Headless batch transformation
+#
+# Applies a chain of translate/scale/rotate operations to many images,
+# without opening a window, using the same warp engine as the editor.
+# The command line is
+#
+#     batch.py {chain file} {input glob} {output directory} [{workers} [{interpolation}]]
+#
+# where {workers} is the number of processes (default: one per CPU) and
+# {interpolation} is one of nearest, bilinear, bicubic or lanczos
+# (default: bicubic).  The glob should be quoted so that the shell does
+# not expand it.
+#
+# The chain file holds a JSON list of operations, applied in order:
+#
+#     [ { "op": "translate", "x": 20, "y": -10 },
+#       { "op": "rotate", "degrees": 30 },
+#       { "op": "scale", "s": 1.5 } ]
+#
+# A rotation can instead be given in radians as "theta".  The
+# operations are composed exactly as the editor composes its
+# accumulated transformation, about the centre of each image, and in
+# the editor's coordinates (images are flipped on loading, so y points
+# up).  Each result is written to the output directory under the input
+# file's name, in the same way that the editor's saveImage() writes it.
+# If files in different directories have the same name, the results
+# are instead written under their paths relative to the directory that
+# holds all of the files, so that none is overwritten.
+#
+# The time to load, transform and save each image is reported, followed
+# by the overall throughput.
+
+
+import sys, os, math, time, json, glob, concurrent.futures
+
+import numpy as np
+from PIL import Image
+
+import warp
+
+
+# Compose the operations in 'chain' into one transformation for an
+# image of the given size
+
+def chainTransform( chain, width, height ):
+
+    cx = width/2 # image centre
+    cy = height/2
+
+    T = np.identity(3)
+
+    for op in chain:
+
+        if op['op'] == 'translate':
+            current = warp.translateTransform( op.get('x',0), op.get('y',0) )
+        elif op['op'] == 'scale':
+            current = warp.scaleTransform( op['s'], cx, cy )
+        elif op['op'] == 'rotate':
+            theta = op['theta'] if 'theta' in op else op['degrees'] * math.pi / 180
+            current = warp.rotateTransform( theta, cx, cy )
+        else:
+            raise ValueError( "operation '%s' not understood" % op['op'] )
+
+        T = np.dot( current, T )
+
+    return T
+
+
+# Output names for the input 'paths': each file's name or, if two of
+# the files have the same name, each file's path relative to the
+# directory that holds all of them
+
+def outputNames( paths ):
+
+    names = [ os.path.basename( path ) for path in paths ]
+
+    if len( set( names ) ) < len( names ):
+        top = os.path.commonpath( [ os.path.dirname( os.path.abspath( path ) ) for path in paths ] )
+        names = [ os.path.relpath( os.path.abspath( path ), top ) for path in paths ]
+
+    return dict( zip( paths, names ) )
+
+
+# Load, transform and save one image to 'outputPath'.  This runs in a
+# worker process.  Returns the input path, the time taken in seconds,
+# and the number of pixels.
+
+def transformFile( inputPath, outputPath, chain, interpolation ):
+
+    startTime = time.perf_counter()
+
+    img = Image.open( inputPath ).convert( 'YCbCr' ).transpose( Image.FLIP_TOP_BOTTOM )
+
+    T = chainTransform( chain, img.size[0], img.size[1] )
+
+    result = warp.warpArray( np.asarray( img ), T, interpolation=interpolation )
+
+    Image.frombytes( 'YCbCr', img.size, result ).transpose( Image.FLIP_TOP_BOTTOM ).convert( 'RGB' ).save( outputPath )
+
+    return inputPath, time.perf_counter() - startTime, img.size[0] * img.size[1]
+
+
+# Transform all files matching 'pattern' on a pool of 'numWorkers'
+# processes
+
+def transformAll( chain, pattern, outputDir, numWorkers, interpolation ):
+
+    inputPaths = sorted( glob.glob( pattern ) )
+
+    if not inputPaths:
+        sys.stderr.write( "No files match '%s'.\n" % pattern )
+        return
+
+    outputPaths = { path : os.path.join( outputDir, name ) for path, name in outputNames( inputPaths ).items() }
+
+    for outputPath in outputPaths.values():
+        os.makedirs( os.path.dirname( outputPath ), exist_ok=True )
+
+    latencies = []
+    numPixels = 0
+
+    startTime = time.perf_counter()
+
+    with concurrent.futures.ProcessPoolExecutor( numWorkers ) as pool:
+
+        futures = { pool.submit( transformFile, path, outputPaths[path], chain, interpolation ) : path
+                    for path in inputPaths }
+
+        for future in concurrent.futures.as_completed( futures ):
+            try:
+                path, seconds, pixels = future.result()
+            except Exception as e:
+                sys.stderr.write( 'Failed to transform %s: %s\n' % (futures[future], e) )
+                continue
+
+            latencies.append( seconds )
+            numPixels += pixels
+            sys.stderr.write( '%s  %.1f ms\n' % (path, seconds*1000) )
+
+    elapsed = time.perf_counter() - startTime
+
+    if latencies:
+        sys.stderr.write( '%d images, %.1f megapixels in %.2f seconds\n' % (len(latencies), numPixels/1e6, elapsed) )
+        sys.stderr.write( 'latency: median %.1f ms, max %.1f ms\n' % (np.median(latencies)*1000, max(latencies)*1000) )
+        sys.stderr.write( 'throughput: %.1f images/s, %.1f megapixels/s\n' % (len(latencies)/elapsed, numPixels/1e6/elapsed) )
+
+
+
+usage = 'Usage: batch.py {chain file} {input glob} {output directory} [{workers} [{interpolation}]]\n'
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 4:
+        sys.stderr.write( usage )
+        sys.exit(1)
+
+    try:
+        with open( sys.argv[1] ) as f:
+            chain = json.load( f )
+        chainTransform( chain, 1, 1 ) # check the operations
+    except Exception as e:
+        sys.stderr.write( "Could not read transform chain '%s': %s\n" % (sys.argv[1], e) )
+        sys.exit(1)
+
+    numWorkers = int( sys.argv[4] ) if len(sys.argv) > 4 else (os.cpu_count() or 1)
+    interpolation = sys.argv[5] if len(sys.argv) > 5 else 'bicubic'
+
+    if interpolation not in warp.interpolations:
+        sys.stderr.write( usage )
+        sys.exit(1)
+
+    transformAll( chain, sys.argv[2], sys.argv[3], numWorkers, interpolation )
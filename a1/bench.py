@@ -0,0 +1,101 @@
+# Warp benchmark
+#
+# Times the editor's translateImage() (by fractions of a pixel, and by
+# whole pixels as 'shift'), scaleImage() and rotateImage() on each
+# image in images/, at several sizes and with each interpolation, and
+# reports the speed in megapixels per second.  The command line is
+#
+#     bench.py [{repeats} [{workers}]]
+#
+# where {repeats} is the number of timed calls of each function
+# (default 5; the median is reported) and {workers} is the number of
+# warp threads (default: one per CPU).
+#
+# No window is opened.  The images are set up as loadImage() sets them
+# up, and the functions are called as a mouse release calls them, so
+# the times are those of the final (not the preview) warps.
+
+
+import sys, os, time, glob, io, contextlib
+
+import numpy as np
+from PIL import Image
+
+import main, warp
+
+
+sizes = [ 0.5, 1, 2 ] # image sizes, relative to the files
+
+operations = [ ('translate', lambda old, new: main.translateImage( old, new, 20.5, -10.25 )),
+               ('shift',     lambda old, new: main.translateImage( old, new, 20, -10 )), # (by whole pixels)
+               ('scale',     lambda old, new: main.scaleImage( old, new, 1.3 )),
+               ('rotate',    lambda old, new: main.rotateImage( old, new, 0.5 )) ]
+
+
+# Set up 'img' as the loaded and current image of the editor
+
+def setImage( img ):
+
+    main.loadedImage  = img
+    main.currentImage = img.copy()
+    main.currentArray = np.array( main.currentImage )
+    main.allTransform = np.identity(3)
+    main.dragging     = False
+
+
+# Return the median time in seconds of 'repeats' calls of 'function'
+
+def timeOperation( function, repeats ):
+
+    times = []
+
+    for i in range(repeats+1): # (the first call is a warm-up)
+
+        main.allTransform = np.identity(3)
+
+        startTime = time.perf_counter()
+        with contextlib.redirect_stdout( io.StringIO() ): # (the functions print their parameters)
+            function( main.loadedImage, main.currentImage )
+        times.append( time.perf_counter() - startTime )
+
+    return np.median( times[1:] )
+
+
+def runBenchmark( repeats ):
+
+    paths = sorted( glob.glob( os.path.join( main.imgDir, '*' ) ) )
+
+    print( '%-14s %11s %-9s %-9s %8s %8s' % ('image', 'size', 'interp', 'op', 'ms', 'MP/s') )
+
+    for path in paths:
+
+        original = Image.open( path ).convert( 'YCbCr' ).transpose( Image.FLIP_TOP_BOTTOM )
+
+        for size in sizes:
+
+            width  = int( original.size[0] * size )
+            height = int( original.size[1] * size )
+
+            setImage( original.resize( (width,height) ) )
+
+            for interpolation in warp.interpolations:
+
+                main.interpolation = interpolation
+
+                for name, function in operations:
+
+                    seconds = timeOperation( function, repeats )
+
+                    print( '%-14s %11s %-9s %-9s %8.1f %8.1f' %
+                           (os.path.basename( path ), '%dx%d' % (width,height), interpolation, name,
+                            seconds*1000, width*height/1e6/seconds) )
+
+
+
+if __name__ == '__main__':
+
+    repeats = int( sys.argv[1] ) if len(sys.argv) > 1 else 5
+
+    warp.setNumWorkers( int( sys.argv[2] ) if len(sys.argv) > 2 else main.warpWorkers )
+
+    runBenchmark( repeats )
@@ -14,7 +14,7 @@
 # of each pixel when doing intensity changes.
 
 
-import sys, os, math
+import sys, os, math, time, collections
 
 try: # NumPy
   import numpy as np
@@ -28,19 +28,31 @@ except:
   print( 'Error: Pillow has not been installed.' )
   sys.exit(0)
 
-try: # PyOpenGL
-  from OpenGL.GLUT import *
-  from OpenGL.GL import *
-  from OpenGL.GLU import *
-except:
-  print( 'Error: PyOpenGL has not been installed.' )
-  sys.exit(0)
+import warp # array-based warp engine
 
-try: # GLFW
-  import glfw
-except:
-  print( 'Error: GLFW has not been installed.' )
-  sys.exit(0)
+
+# PyOpenGL and GLFW are imported by importGUI() when the interactive
+# session starts, not here, so that this module can be imported (e.g.
+# by bench.py) quickly and without them.
+
+def importGUI():
+
+  global glfw
+
+  try: # PyOpenGL
+    import OpenGL.GLUT, OpenGL.GL, OpenGL.GLU
+  except:
+    print( 'Error: PyOpenGL has not been installed.' )
+    sys.exit(0)
+
+  for module in [ OpenGL.GLUT, OpenGL.GL, OpenGL.GLU ]: # (as 'from OpenGL.GL import *' would)
+    globals().update( { name : value for name, value in vars(module).items() if not name.startswith('_') } )
+
+  try: # GLFW
+    import glfw
+  except:
+    print( 'Error: GLFW has not been installed.' )
+    sys.exit(0)
 
 
 
@@ -55,6 +67,9 @@ imgFilename = 'pup.jpg'
 loadedImage  = None  # image originally loaded
 currentImage = None  # image being displayed
 
+currentArray = None  # pixels of currentImage, as a contiguous uint8 array
+currentImageChanged = True  # currentArray changed since it was last uploaded
+
 
 
 # File dialog (doesn't work on Mac OSX)
@@ -71,6 +86,19 @@ if haveTK:
 allTransform = np.array([[1,0,0],
                          [0,1,0],
                          [0,0,1]])
+
+#the transformation currently being made with the mouse
+currentTransform = np.identity(3)
+
+#interpolation used by transformImage (one of warp.interpolations).
+#While a mouse button is held, the cheaper dragInterpolation is used,
+#and the image is re-rendered with finalInterpolation on release.
+dragInterpolation  = 'bilinear'
+finalInterpolation = 'bicubic'
+interpolation      = finalInterpolation
+
+#number of threads that the warp engine runs tiles on
+warpWorkers = os.cpu_count() or 1
   
 
 # Apply an arbitrary (invertible) 3x3 homogeneous transformation to
@@ -83,9 +111,6 @@ def transformImage( oldImage, newImage, forwardTransform ):
   
     width, height = oldImage.size # (same as newImage.size)
 
-    srcPixels = oldImage.load()
-    dstPixels = newImage.load()
-
     # Using backward projection, fill in the dstPixels array by
     # finding, for each location dstPixels[dstX,dstY], the
     # corresponding source location srcPixels[srcX,srcY], and copying
@@ -106,21 +131,79 @@ def transformImage( oldImage, newImage, forwardTransform ):
     #transformation
     T = np.dot(forwardTransform, allTransform)
 
-    #iterate through all pixel indices
-    for dx in range(width):
-      for dy in range(height):
-        #backproject point (dx, dy) in destination to source pixel address
-        #by multiplying with the inverse of the accumulated forward
-        #transformation matrix
-        sx, sy, _ = np.dot(np.linalg.inv(T),np.array([dx,dy,1]))
-
-        #check if source x and y values are out of allowed range
-        if sx < 0 or sx >= width or sy < 0 or sy >= height:
-          #if so, map black to destination pixel
-          dstPixels[dx,dy] = (0,128,128)
-        else:
-          #otherwise take source pixel
-          dstPixels[dx,dy] = srcPixels[sx,sy]
+    #the displayed image is rendered straight into its working buffer
+    global currentImageChanged
+    if newImage is currentImage:
+      dstArray = currentArray
+      currentImageChanged = True
+    else:
+      dstArray = np.empty(np.asarray(oldImage).shape, np.uint8)
+
+    startTime = time.perf_counter()
+
+    #warp the whole image at once: the accumulated transformation is
+    #inverted once and every destination pixel is back-projected with
+    #a few whole-array operations (see warp.py)
+    #
+    #while a mouse button is held, warp a smaller level of the loaded
+    #image's pyramid instead and enlarge the result for display
+    level = previewLevel(oldImage, T)
+
+    if level > 0:
+      factor = 2**level
+      levelArray = warp.warpArray(pyramid[level], warp.levelTransform(T, factor),
+                                  interpolation=interpolation)
+      warp.upsample(levelArray, factor, dstArray)
+    else:
+      srcArray = np.asarray(oldImage)
+      warp.warpArray(srcArray, T, dstArray, interpolation=interpolation)
+
+    recordTime('warp', startTime)
+
+    #copy the result into newImage in place, so that it stays in step
+    #with the working buffer
+    newImage.frombytes(dstArray)
+
+
+# Progressive rendering
+#
+# While a mouse button is held, transformImage() renders from a level
+# of 'pyramid' (a mip pyramid of loadedImage, built in loadImage())
+# that has at most 'previewPixels' pixels, using no level smaller than
+# 1/2**maxPreviewLevel.  The full-resolution image is rendered when the
+# button is released.
+#
+# A translation by whole pixels is rendered at full resolution even
+# while dragging, as it is a slice copy (see warp.py), which is much
+# cheaper than enlarging a level (e.g. 0.4 ms vs 6 ms at 1024x768).
+# For the other kinds, the preview is cheaper: nearest-neighbour
+# scales come closest, at about the same time at 512x384, but 6 vs
+# 7 ms at 1024x768 and 24 vs 33 ms at 2048x1536.
+
+progressive     = True
+previewPixels   = 150000
+maxPreviewLevel = 2
+
+pyramid  = []
+dragging = False
+
+def previewLevel( oldImage, T ):
+
+    if not progressive or not dragging or oldImage is not loadedImage:
+      return 0
+
+    if warp.classifyTransform(T) == 'translation':
+      return 0
+
+    width, height = oldImage.size
+
+    level = 0
+    while level < min(maxPreviewLevel, len(pyramid)-1) and width*height > previewPixels:
+      level += 1
+      width, height = width//2, height//2
+
+    return level
+
 
 # Scale an image by s around its centre
 
@@ -142,16 +225,8 @@ def scaleImage( oldImage, newImage, s ):
 
     #compute T as T3*T2*T1 where T1 is a transformation to the origin,
     #T2 scales the image by factor sand T3 transforms it back to the
-    #original location
-    T = np.dot(np.array([[1,0,cx],
-                         [0,1,cy],
-                         [0,0,1]]),
-               np.dot(np.array([[s,0,0],
-                                [0,s,0],
-                                [0,0,1]]),
-                      np.array([[1,0,-cx],
-                                [0,1,-cy],
-                                [0,0,1]])))
+    #original location (see warp.py)
+    T = warp.scaleTransform(s, cx, cy)
     # Call the generic transformation code with T
     transformImage(oldImage, newImage, T)
   
@@ -171,16 +246,8 @@ def rotateImage( oldImage, newImage, theta ):
 
     #compute T as T3*T2*T1 where T1 is a transformation to the origin,
     #T2 rotates the image by theta rad and T3 transforms it back to the
-    #original location
-    T = np.dot(np.array([[1,0,cx],
-                         [0,1,cy],
-                         [0,0,1]]),
-               np.dot(np.array([[math.cos(theta),-math.sin(theta),0],
-                                [math.sin(theta),math.cos(theta),0],
-                                [0,0,1]]),
-                      np.array([[1,0,-cx],
-                                [0,1,-cy],
-                                [0,0,1]])))
+    #original location (see warp.py)
+    T = warp.rotateTransform(theta, cx, cy)
     # Call the generic transformation code with T
     transformImage(oldImage, newImage, T)
 
@@ -191,9 +258,7 @@ def translateImage( oldImage, newImage, x, y ):
 
     # Compute the homogeneous transformation
   
-    T = np.array( [[1,0,x],
-                   [0,1,y],
-                   [0,0,1]] )
+    T = warp.translateTransform( x, y )
 
     # Call the generic transformation code
 
@@ -201,34 +266,237 @@ def translateImage( oldImage, newImage, x, y ):
 
 
 
+# Transformation history
+#
+# 'history' holds the accumulated transformation after each completed
+# mouse drag, and history[historyPos] is the one being shown.  Undo
+# and redo move historyPos and show that transformation.  A new drag
+# after an undo discards the transformations that could be redone.
+#
+# Rendered frames are kept in 'frameCache', keyed by the accumulated
+# transformation and the interpolation, so that stepping through the
+# history or returning to an earlier state does not warp the image
+# again.  The least recently used frames are discarded to keep the
+# cache under 'frameCacheBytes'.
+
+history    = [ allTransform ]
+historyPos = 0
+
+frameCacheBytes = 256 * 2**20
+frameCache      = collections.OrderedDict()
+
+
+def pushHistory( T ):
+
+    global history, historyPos
+
+    history = history[:historyPos+1] + [ T ]
+    historyPos = len(history) - 1
+
+
+def stepHistory( step ):
+
+    global historyPos, allTransform, interpolation
+
+    if 0 <= historyPos+step < len(history):
+      historyPos += step
+      allTransform = history[historyPos]
+      interpolation = finalInterpolation
+      renderAccumulated()
+
+
+def frameKey( T ):
+
+    return (np.round( T, 9 ).tobytes(), interpolation)
+
+
+# Show the accumulated transformation of the loaded image, from the
+# cache if it has been rendered before
+
+def renderAccumulated():
+
+    global currentImageChanged
+
+    key = frameKey( allTransform )
+
+    if key in frameCache:
+
+      frameCache.move_to_end( key )
+      currentArray[...] = frameCache[key]
+      currentImage.frombytes( currentArray )
+      currentImageChanged = True
+
+    else:
+
+      transformImage( loadedImage, currentImage, np.identity(3) )
+
+      if currentArray.nbytes <= frameCacheBytes:
+        frameCache[key] = currentArray.copy()
+        while sum( frame.nbytes for frame in frameCache.values() ) > frameCacheBytes:
+          frameCache.popitem( last=False )
+
+
+# Frame timing
+#
+# If 'frameTiming' is True (toggle it with 't'), the time of each
+# frame's warp, RGB conversion and texture upload is recorded, and the
+# median (p50) and 99th percentile (p99) of the last
+# 'frameTimingWindow' frames are printed every 'frameTimingInterval'
+# frames.  (The upload time is the time to hand the pixels to OpenGL.)
+
+frameTiming         = False
+frameTimingWindow   = 600
+frameTimingInterval = 60
+
+frameTimes = { stage : collections.deque( maxlen=frameTimingWindow )
+               for stage in ['warp','convert','upload'] }
+numFrames  = 0
+
+
+# Record the time since 'startTime' for a stage, and return the
+# current time
+
+def recordTime( stage, startTime ):
+
+    now = time.perf_counter()
+
+    if frameTiming:
+      frameTimes[stage].append( now - startTime )
+
+    return now
+
+
+def endFrame():
+
+    global numFrames
+
+    if frameTiming:
+      numFrames += 1
+      if numFrames % frameTimingInterval == 0:
+        reportFrameTimes()
+
+
+def reportFrameTimes():
+
+    report = []
+
+    for stage, times in frameTimes.items():
+      if times:
+        p50, p99 = np.percentile( times, [50,99] ) * 1000
+        report.append( '%s p50 %.1f ms p99 %.1f ms' % (stage, p50, p99) )
+
+    print( 'frame %d: %s' % (numFrames, ', '.join( report )) )
+
+
+# YCbCr to RGB conversion
+#
+# Uses the JFIF equations (as PIL does), with the Cb and Cr terms
+# looked up in 256-entry tables so that converting an image takes a few
+# whole-array operations.
+
+chroma = np.arange( 256 ) - 128
+
+crToR = np.round(  1.402    * chroma ).astype( np.int16 )
+cbToG = np.round( -0.344136 * chroma ).astype( np.int16 )
+crToG = np.round( -0.714136 * chroma ).astype( np.int16 )
+cbToB = np.round(  1.772    * chroma ).astype( np.int16 )
+
+def ycbcrToRGB( ycbcr, rgb ):
+
+    Y  = ycbcr[:,:,0].astype( np.int16 )
+    Cb = ycbcr[:,:,1]
+    Cr = ycbcr[:,:,2]
+
+    np.clip( Y + crToR[Cr],              0, 255, out=rgb[:,:,0], casting='unsafe' )
+    np.clip( Y + cbToG[Cb] + crToG[Cr],  0, 255, out=rgb[:,:,1], casting='unsafe' )
+    np.clip( Y + cbToB[Cb],              0, 255, out=rgb[:,:,2], casting='unsafe' )
+
+
 # Set up the display and draw the current image
+#
+# The image is kept in a texture that persists between frames.  It is
+# converted and uploaded (with glTexSubImage2D, into the existing
+# texture) only when currentArray has changed, so a redraw caused by
+# a window event just draws one textured quad.
+
+texID   = None       # OpenGL texture holding the current image
+texSize = None       # (width,height) of that texture
+rgbArray = None      # RGB pixels uploaded to the texture
 
 def display( window ):
 
+    global texID, texSize, rgbArray, currentImageChanged
+
     # Clear window
 
     glClearColor ( 1, 1, 1, 0 )
     glClear( GL_COLOR_BUFFER_BIT )
 
-    # rebuild the image
+    glViewport( 0, 0, windowWidth, windowHeight )
+
+    glMatrixMode( GL_PROJECTION )
+    glLoadIdentity()
+    glOrtho( 0, windowWidth, 0, windowHeight, -1, 1 )
+
+    glMatrixMode( GL_MODELVIEW )
+    glLoadIdentity()
+
+    height, width = currentArray.shape[:2]
+
+    # Upload the image, if it changed
+
+    if texID is None:
+      texID = glGenTextures( 1 )
+
+    glBindTexture( GL_TEXTURE_2D, texID )
+    glPixelStorei( GL_UNPACK_ALIGNMENT, 1 )
 
-    img = currentImage.convert( 'RGB' )
+    if texSize != (width,height) or currentImageChanged:
 
-    width  = img.size[0]
-    height = img.size[1]
+      startTime = time.perf_counter()
+
+      if texSize != (width,height):
+        rgbArray = np.empty( (height,width,3), np.uint8 )
+
+      ycbcrToRGB( currentArray, rgbArray )
+
+      startTime = recordTime( 'convert', startTime )
+
+      if texSize != (width,height):
+        glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST )
+        glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST )
+        glTexImage2D( GL_TEXTURE_2D, 0, GL_RGB8, width, height, 0, GL_RGB, GL_UNSIGNED_BYTE, rgbArray )
+        texSize = (width,height)
+      else:
+        glTexSubImage2D( GL_TEXTURE_2D, 0, 0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE, rgbArray )
+
+      recordTime( 'upload', startTime )
+      endFrame()
+
+    currentImageChanged = False
 
     # Find where to position lower-left corner of image
 
-    baseX = (windowWidth-width)/2
-    baseY = (windowHeight-height)/2
+    baseX = int( (windowWidth-width)/2 )
+    baseY = int( (windowHeight-height)/2 )
 
-    glWindowPos2i( int(baseX), int(baseY) )
+    # Draw the texture at one texel per pixel
 
-    # Get pixels and draw
+    glTexEnvf( GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE )
+    glEnable( GL_TEXTURE_2D )
 
-    imageData = np.array( list( img.getdata() ), np.uint8 )
+    glBegin( GL_QUADS )
+    glTexCoord2f( 0, 0 )
+    glVertex2f( baseX, baseY )
+    glTexCoord2f( 1, 0 )
+    glVertex2f( baseX+width, baseY )
+    glTexCoord2f( 1, 1 )
+    glVertex2f( baseX+width, baseY+height )
+    glTexCoord2f( 0, 1 )
+    glVertex2f( baseX, baseY+height )
+    glEnd()
 
-    glDrawPixels( width, height, GL_RGB, GL_UNSIGNED_BYTE, imageData )
+    glDisable( GL_TEXTURE_2D )
 
     glfw.swap_buffers( window )
 
@@ -238,6 +506,8 @@ def display( window ):
 
 def keyCallback( window, key, scancode, action, mods ):
 
+  global frameTiming
+
   if action == glfw.PRESS:
     
     if key == glfw.KEY_ESCAPE:	# quit upon ESC
@@ -255,6 +525,17 @@ def keyCallback( window, key, scancode, action, mods ):
             if outputPath:
                 saveImage( outputPath )
 
+    elif key == glfw.KEY_U: # undo the last transformation
+        stepHistory( -1 )
+
+    elif key == glfw.KEY_R: # redo the last undone transformation
+        stepHistory( +1 )
+
+    elif key == glfw.KEY_T: # toggle the frame timing log
+        frameTiming = not frameTiming
+        for times in frameTimes.values():
+          times.clear()
+
     else:
         print( 'key =', key ) # DO NOT TOUCH THIS LINE
 
@@ -270,11 +551,26 @@ def keyCallback( window, key, scancode, action, mods ):
 
 def loadImage( path ):
 
-    global loadedImage, currentImage
+    global loadedImage, currentImage, currentArray, currentImageChanged, pyramid
 
     loadedImage = Image.open( path ).convert( 'YCbCr' ).transpose( Image.FLIP_TOP_BOTTOM )
     currentImage = loadedImage.copy()
 
+    currentArray = np.array( currentImage )
+    currentImageChanged = True
+
+    # the new image is shown untransformed, so the transformation and
+    # the history start again from the identity
+
+    global history, historyPos, allTransform
+
+    allTransform = np.identity(3)
+    history = [ allTransform ]
+    historyPos = 0
+    frameCache.clear()
+
+    pyramid = warp.buildPyramid( np.asarray( loadedImage ), maxPreviewLevel+1 )
+
 
 def saveImage( path ):
 
@@ -307,21 +603,35 @@ button = None
 
 def mouseButtonCallback( window, btn, action, keyModifiers ):
 
-    global button, initX, initY
+    global button, initX, initY, interpolation, currentTransform, allTransform, dragging
 
     if action == glfw.PRESS:
 
         button = btn
         initX, initY = glfw.get_cursor_pos( window ) # store mouse position
 
+        #start a new transformation, rendered with the faster
+        #interpolation while dragging
+        currentTransform = np.identity(3)
+        interpolation = dragInterpolation
+        dragging = True
+
     elif action == glfw.RELEASE:
         
         button = None
         #after the button is released then the accumulated transformation
         #matrix is updated
-        global currentTransform, allTransform
         allTransform = np.dot(currentTransform, allTransform)
 
+        #record it in the history (unless the drag did not change the
+        #transformation, e.g. a click), then re-render the accumulated
+        #transformation at full resolution and full quality
+        interpolation = finalInterpolation
+        dragging = False
+        if not np.array_equal(currentTransform, np.identity(3)):
+            pushHistory(allTransform)
+        renderAccumulated()
+
     
 
 # Handle mouse motion.  We don't want to transform the image and
@@ -397,6 +707,8 @@ def actOnMouseMovement( window, button, x, y ):
 def main():
 
     global mousePositionChanged, button
+
+    importGUI()
     
     if not glfw.init():
         print( 'Error: GLFW failed to initialize' )
@@ -411,6 +723,8 @@ def main():
 
     glfw.make_context_current( window )
 
+    warp.setNumWorkers( warpWorkers )
+
     glfw.swap_interval( 1 )  # redraw at most every 1 screen scan
 
     # Callbacks
@@ -434,14 +748,17 @@ def main():
 
     # Main event loop
 
-    prevX, prevY = glfw.get_cursor_pos( window )
-
     while not glfw.window_should_close( window ):
 
         glfw.wait_events()
 
-        currentX, currentY = glfw.get_cursor_pos( window )
-        if currentX != prevX or currentY != prevY:
+        # wait_events() handles all of the events queued while the
+        # previous frame was rendered, so the cursor movements since
+        # then are coalesced and only the latest position is rendered.
+
+        if mousePositionChanged:
+          mousePositionChanged = False
+          currentX, currentY = glfw.get_cursor_pos( window )
           actOnMouseMovement( window, button, currentX, currentY )
 
         display( window )
@@ -0,0 +1,221 @@
+# Streaming warp of very large images
+#
+# Applies a chain of translate/scale/rotate operations (as in batch.py)
+# to an image that need not fit in memory.  The command line is
+#
+#     stream.py {chain file} {input} {output} [{tile size} [{interpolation}]]
+#
+# {input} is either a binary PPM file (P6 with maxval 255) or a raw
+# file of 8-bit RGB pixels, given as {path}:{width}x{height}.  The
+# {output} is written as a binary PPM file of the same size.  The tile
+# size defaults to 512 and the interpolation to bicubic.
+#
+# Both files are memory-mapped.  The destination is done in strips of
+# {tile size} rows, each split into tiles of {tile size} columns.  For
+# each tile, the corners are back-projected to find the bounding box
+# of the source pixels the tile needs, and only that part of the
+# source is read.  The warped tile is written straight into the mapped
+# output.  So the memory used depends on the tile size (and the amount
+# of scaling), and not on the image size.
+#
+# As in the editor, the image is flipped so that y points up, and
+# pixels outside the source are black.
+
+
+import sys, os, time, json
+
+import numpy as np
+
+import warp, batch
+
+
+rgbBlack = np.array( [0,0,0], np.uint8 )
+
+
+# Read the header of a binary PPM file.  Returns the width, height and
+# the offset of the pixel data.
+
+def readPPMHeader( f ):
+
+    tokens = []
+    offset = 0
+
+    f.seek( 0 )
+    data = f.read( 1024 )
+
+    while len(tokens) < 4:
+
+        if offset >= len(data):
+            raise ValueError( 'incomplete PPM header' )
+
+        ch = data[offset:offset+1]
+
+        if ch == b'#': # comment to end of line
+            offset = data.index( b'\n', offset )
+        elif ch.isspace():
+            offset += 1
+        else:
+            end = offset
+            while end < len(data) and not data[end:end+1].isspace():
+                end += 1
+            tokens.append( data[offset:end] )
+            offset = end
+
+    offset += 1 # single whitespace character before the pixels
+
+    if tokens[0] != b'P6' or int(tokens[3]) != 255:
+        raise ValueError( 'only 8-bit binary PPM (P6) files are supported' )
+
+    return int(tokens[1]), int(tokens[2]), offset
+
+
+# Memory-map an input image, returning a read-only (height,width,3)
+# array.  'spec' is a PPM path or {path}:{width}x{height} for raw RGB.
+
+def openImage( spec ):
+
+    if ':' in spec and not os.path.exists( spec ):
+        path, size = spec.rsplit( ':', 1 )
+        width, height = [ int(n) for n in size.lower().split( 'x' ) ]
+        offset = 0
+    else:
+        path = spec
+        with open( path, 'rb' ) as f:
+            width, height, offset = readPPMHeader( f )
+
+    return np.memmap( path, np.uint8, 'r', offset, (height,width,3) )
+
+
+# Create a binary PPM file and memory-map its pixels
+
+def createPPM( path, width, height ):
+
+    header = b'P6\n%d %d\n255\n' % (width, height)
+
+    with open( path, 'wb' ) as f:
+        f.write( header )
+        f.truncate( len(header) + width*height*3 )
+
+    return np.memmap( path, np.uint8, 'r+', len(header), (height,width,3) )
+
+
+# Find the box of source pixels [bx0,bx1) x [by0,by1) needed for the
+# destination tile [x0,x1) x [y0,y1), with 'margin' extra pixels for
+# the interpolation kernel, clipped to the source.  Returns None if the
+# tile needs no source pixels.
+#
+# The box is found from the back-projected tile corners.  If the tile
+# straddles the horizon of a projective transformation, the corners do
+# not bound it, so the whole source is used.
+
+def sourceBox( inverse, x0, x1, y0, y1, margin, srcWidth, srcHeight ):
+
+    corners = np.array( [[x0,x1,x0,x1],
+                         [y0,y0,y1,y1],
+                         [1, 1, 1, 1 ]], np.float64 )
+
+    src = np.dot( inverse, corners )
+
+    if np.any( src[2] <= 0 ):
+        return 0, srcWidth, 0, srcHeight
+
+    sx = src[0] / src[2]
+    sy = src[1] / src[2]
+
+    bx0 = max( 0, int( np.floor( sx.min() ) ) - margin )
+    bx1 = min( srcWidth, int( np.ceil( sx.max() ) ) + margin + 1 )
+    by0 = max( 0, int( np.floor( sy.min() ) ) - margin )
+    by1 = min( srcHeight, int( np.ceil( sy.max() ) ) + margin + 1 )
+
+    if bx0 >= bx1 or by0 >= by1:
+        return None
+
+    return bx0, bx1, by0, by1
+
+
+# Warp 'src' into 'dst' (both (height,width,3) arrays, typically
+# memory-mapped) by the forward transformation 'T', one tile at a time
+
+def streamWarp( src, T, dst, interpolation, tileSize, fill=rgbBlack ):
+
+    srcHeight, srcWidth = src.shape[:2]
+    height, width = dst.shape[:2]
+
+    inverse = np.linalg.inv( T )
+
+    margin = warp.kernels[interpolation][0] if interpolation in warp.kernels else 1
+
+    for y0 in range(0,height,tileSize):
+
+        y1 = min( y0+tileSize, height )
+
+        for x0 in range(0,width,tileSize):
+
+            x1 = min( x0+tileSize, width )
+
+            tile = np.empty( (y1-y0,x1-x0,3), np.uint8 )
+            box  = sourceBox( inverse, x0, x1, y0, y1, margin, srcWidth, srcHeight )
+
+            if box is None:
+                tile[...] = fill
+            else:
+                bx0, bx1, by0, by1 = box
+
+                block = np.ascontiguousarray( src[by0:by1,bx0:bx1] )
+
+                # inverse in tile and block coordinates
+
+                local = np.dot( warp.translateTransform( -bx0, -by0 ),
+                                np.dot( inverse, warp.translateTransform( x0, y0 ) ) )
+
+                warp.warpInverse( block, local, tile, interpolation, fill )
+
+            dst[y0:y1,x0:x1] = tile
+
+    if isinstance( dst, np.memmap ):
+        dst.flush()
+
+
+
+usage = 'Usage: stream.py {chain file} {input} {output} [{tile size} [{interpolation}]]\n'
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 4:
+        sys.stderr.write( usage )
+        sys.exit(1)
+
+    try:
+        with open( sys.argv[1] ) as f:
+            chain = json.load( f )
+        batch.chainTransform( chain, 1, 1 ) # check the operations
+    except Exception as e:
+        sys.stderr.write( "Could not read transform chain '%s': %s\n" % (sys.argv[1], e) )
+        sys.exit(1)
+
+    try:
+        src = openImage( sys.argv[2] )
+    except Exception as e:
+        sys.stderr.write( "Could not open input image '%s': %s\n" % (sys.argv[2], e) )
+        sys.exit(1)
+
+    tileSize = int( sys.argv[4] ) if len(sys.argv) > 4 else 512
+    interpolation = sys.argv[5] if len(sys.argv) > 5 else 'bicubic'
+
+    if interpolation not in warp.interpolations:
+        sys.stderr.write( usage )
+        sys.exit(1)
+
+    height, width = src.shape[:2]
+
+    dst = createPPM( sys.argv[3], width, height )
+
+    startTime = time.perf_counter()
+
+    T = batch.chainTransform( chain, width, height )
+
+    streamWarp( src[::-1], T, dst[::-1], interpolation, tileSize ) # (y is flipped)
+
+    elapsed = time.perf_counter() - startTime
+
+    sys.stderr.write( 'Warp time %.2f seconds (%.1f megapixels/s)\n' % (elapsed, width*height/1e6/elapsed) )
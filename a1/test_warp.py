@@ -0,0 +1,140 @@
+# Tests of the warp fast paths and tiling in warp.py
+#
+# Run with 'python -m pytest' in this directory.
+
+
+import os
+
+import numpy as np
+from PIL import Image
+
+import warp
+
+
+imageDir = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'images' )
+
+
+# A part of the mandrill image as a YCbCr array (its fine texture makes
+# differences show)
+
+def sourceArray():
+
+    image = Image.open( os.path.join( imageDir, 'mandrill.png' ) ).convert( 'YCbCr' )
+
+    return np.ascontiguousarray( np.asarray( image )[:150,:170] )
+
+
+# Warp with warpArray() (which uses the fast path for the kind of
+# transformation) and with generalWarp().  Returns both results and
+# the kind.
+
+def warpBoth( srcArray, T, interpolation ):
+
+    inverse = np.linalg.inv( T )
+
+    fast = warp.warpArray( srcArray, T, None, interpolation )
+
+    general = np.empty_like( srcArray )
+    warp.generalWarp( srcArray, inverse, general, interpolation )
+
+    return fast, general, warp.classifyTransform( inverse )
+
+
+# Translations by whole pixels are the same as the general warp, for
+# every interpolation
+
+def test_translation():
+
+    src = sourceArray()
+
+    for interpolation in warp.interpolations:
+        for dx, dy in [ (0,0), (13,-7), (-40,25), (500,0) ]:
+            fast, general, kind = warpBoth( src, warp.translateTransform( dx, dy ), interpolation )
+            assert kind == 'translation'
+            assert np.array_equal( fast, general )
+
+
+# Scales (and sub-pixel translations) are the same as the general warp,
+# up to rounding to 8 bits
+
+def test_scale():
+
+    src = sourceArray()
+
+    transforms = [ warp.scaleTransform( 1.7, 80, 70 ),
+                   warp.scaleTransform( 0.6, 80, 70 ),
+                   warp.translateTransform( 3.25, -1.5 ) ]
+
+    for interpolation in warp.interpolations:
+        for T in transforms:
+            fast, general, kind = warpBoth( src, T, interpolation )
+            assert kind == 'scale'
+            assert np.abs( fast.astype( int ) - general ).max() <= 1
+
+
+# A smooth YCbCr test image of the given size
+
+def smoothArray( height, width ):
+
+    ys, xs = np.mgrid[:height,:width]
+
+    image = np.empty( (height,width,3), np.uint8 )
+    image[:,:,0] = 128 + 60 * np.sin( xs/9.0 ) * np.cos( ys/7.0 )
+    image[:,:,1] = 128 + 40 * np.cos( (xs+ys)/11.0 )
+    image[:,:,2] = 128
+
+    return image
+
+
+# Rotations with Lanczos use three shears, each of which resamples the
+# image.  That blurs fine texture slightly more than the general warp
+# does, so they are compared on a smooth image, where they agree up to
+# rounding.  With the other interpolations, the general warp is used.
+
+def test_rotation():
+
+    src = smoothArray( 150, 170 )
+
+    for interpolation in warp.interpolations:
+        for theta in [ 0.3, -1.2, 2.5 ]:
+
+            fast, general, kind = warpBoth( src, warp.rotateTransform( theta, 85, 75 ), interpolation )
+            assert kind == 'rotation'
+
+            diff = np.abs( fast.astype( int ) - general )
+
+            if interpolation == 'lanczos':
+                assert diff.mean() < 0.1
+                assert diff.max() <= 4
+            else:
+                assert diff.max() == 0
+
+
+# The result does not depend on the tile size or the number of workers
+
+def test_tiling():
+
+    src = sourceArray()
+
+    transforms = [ warp.translateTransform( 5, 9 ),
+                   warp.scaleTransform( 1.3, 80, 70 ),
+                   warp.rotateTransform( 0.7, 85, 75 ),
+                   np.array( [[1.1,0.3,-5],[0.2,0.9,4],[0,0,1]] ),
+                   np.array( [[1,0.1,0],[0.05,1,0],[0.0005,0.0002,1]] ) ]
+
+    oldTileSize, oldNumWorkers = warp.tileSize, warp.numWorkers
+
+    try:
+        for interpolation in warp.interpolations:
+            for T in transforms:
+
+                warp.tileSize, warp.numWorkers = 10**6, 1
+                untiled = warp.warpArray( src, T, None, interpolation )
+
+                for tileSize, numWorkers in [ (17,1), (64,3) ]:
+                    warp.tileSize = tileSize
+                    warp.setNumWorkers( numWorkers )
+                    assert np.array_equal( warp.warpArray( src, T, None, interpolation ), untiled )
+    finally:
+        warp.tileSize = oldTileSize
+        warp.setNumWorkers( oldNumWorkers )
@@ -0,0 +1,188 @@
+# Headless batch grid removal
+#
+# Removes the grid from many ECG pages, without opening a window or
+# loading OpenGL, on a pool of processes.  The command line is
+#
+#     batch.py {input directory or glob} {output directory} [{workers} [{engine} [templates]]]
+#
+# where {workers} is the number of processes (default: one per CPU)
+# and {engine} is 'array' (the default) or 'peaks', as for
+# 'computeEngine' in main.py.  With 'templates', grid templates (see
+# templates.py) are used, so pages with the same grid as an earlier
+# page done by the same process are done more quickly.  A glob should
+# be quoted so that the shell does not expand it.
+#
+# Each page is loaded and its grid removed as compute() does, and the
+# result is written to the output directory under the page's file
+# name, as the 'o' command of main.py writes it.  (If pages in
+# different directories have the same file name, the results are
+# written under their paths relative to the directory that holds all
+# of the pages instead, so that none is overwritten.)  The grid lines
+# found for each page are written to lines.csv in the output
+# directory, and the time for each page is reported, with the step of
+# compute() that took the most of it.  The metrics of each page (see
+# degrid.newMetrics()) are written to metrics.jsonl in the output
+# directory, as one line of JSON per page.
+#
+# Only pages.py and degrid.py (with NumPy and Pillow) are imported, so
+# the workers start quickly.
+
+
+import sys, os, time, glob, csv, json, io, contextlib, concurrent.futures
+
+import numpy as np
+
+import pages, degrid
+
+
+imageExtensions = [ '.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.gif' ]
+
+
+# Remove the grid from one page and write the result to 'outputPath'.
+# This runs in a worker process.  Returns the input path, the lines,
+# the time taken in seconds and the metrics from degrid.removeGrid().
+
+def processFile( inputPath, outputPath, engine, useTemplates=False ):
+
+  startTime = time.perf_counter()
+
+  with contextlib.redirect_stdout( io.StringIO() ): # (loadImage() and removeGrid() print)
+
+    try:
+      image = pages.loadImage( inputPath )
+    except SystemExit: # (loadImage() exits if it fails)
+      raise ValueError( 'could not load the image' )
+
+    imageHalfFT, gridHalfFT, gridImage, resultImage, lines, metrics = degrid.removeGrid( image, engine == 'peaks', useTemplates=useTemplates )
+
+  pages.outputImage( resultImage, outputPath, False, False, True )
+
+  return inputPath, lines, time.perf_counter() - startTime, metrics
+
+
+# List the pages in a directory, or those matching a glob
+
+def findPages( pattern ):
+
+  if os.path.isdir( pattern ):
+    return sorted( os.path.join( pattern, name ) for name in os.listdir( pattern )
+                   if os.path.splitext( name )[1].lower() in imageExtensions )
+  else:
+    return sorted( glob.glob( pattern ) )
+
+
+# Output names for the pages in 'paths': each page's file name or, if
+# two of the pages have the same file name, each page's path relative
+# to the directory that holds all of them
+
+def outputNames( paths ):
+
+  names = [ os.path.basename( path ) for path in paths ]
+
+  if len( set( names ) ) < len( names ):
+    top = os.path.commonpath( [ os.path.dirname( os.path.abspath( path ) ) for path in paths ] )
+    names = [ os.path.relpath( os.path.abspath( path ), top ) for path in paths ]
+
+  return dict( zip( paths, names ) )
+
+
+# The row of lines.csv for a page
+
+linesHeader = [ 'file', 'angle1', 'distance1', 'angle2', 'distance2', 'ms' ]
+
+def linesRow( name, lines, seconds ):
+
+  return [ name ] + [ '%.4f' % value for line in lines for value in line ] + [ '%.1f' % (seconds*1000) ]
+
+
+# The report of a page's time, with the step that took the most of it
+
+def pageReport( name, seconds, metrics ):
+
+  step, fraction = degrid.slowestStep( metrics )
+
+  return '%s  %.1f ms  (%.0f%% in %s)\n' % (name, seconds*1000, fraction*100, step)
+
+
+# The line of metrics.jsonl for a page
+
+def metricsLine( name, metrics ):
+
+  return json.dumps( dict( metrics, file=name ) ) + '\n'
+
+
+# Process all pages on a pool of 'numWorkers' processes
+
+def processAll( pattern, outputDir, numWorkers, engine, useTemplates=False ):
+
+  inputPaths = findPages( pattern )
+
+  if not inputPaths:
+    sys.stderr.write( "No pages found in '%s'.\n" % pattern )
+    return
+
+  names = outputNames( inputPaths )
+
+  for name in names.values():
+    os.makedirs( os.path.dirname( os.path.join( outputDir, name ) ), exist_ok=True )
+
+  results = {}
+
+  startTime = time.perf_counter()
+
+  with concurrent.futures.ProcessPoolExecutor( numWorkers ) as pool:
+
+    futures = { pool.submit( processFile, path, os.path.join( outputDir, names[path] ), engine, useTemplates ) : path
+                for path in inputPaths }
+
+    for future in concurrent.futures.as_completed( futures ):
+      try:
+        path, lines, seconds, metrics = future.result()
+      except Exception as e:
+        sys.stderr.write( 'Failed to process %s: %s\n' % (futures[future], e) )
+        continue
+
+      results[path] = (lines, seconds, metrics)
+      sys.stderr.write( pageReport( path, seconds, metrics ) )
+
+  elapsed = time.perf_counter() - startTime
+
+  # write the lines and metrics in the order of the pages
+
+  with open( os.path.join( outputDir, 'lines.csv' ), 'w', newline='' ) as f, \
+       open( os.path.join( outputDir, 'metrics.jsonl' ), 'w' ) as metricsFile:
+
+    writer = csv.writer( f )
+    writer.writerow( linesHeader )
+
+    for path in inputPaths:
+      if path in results:
+        lines, seconds, metrics = results[path]
+        writer.writerow( linesRow( names[path], lines, seconds ) )
+        metricsFile.write( metricsLine( names[path], metrics ) )
+
+  if results:
+    latencies = [ seconds for lines, seconds, metrics in results.values() ]
+    sys.stderr.write( '%d pages in %.2f seconds\n' % (len(results), elapsed) )
+    sys.stderr.write( 'latency: median %.1f ms, max %.1f ms\n' % (np.median(latencies)*1000, max(latencies)*1000) )
+    sys.stderr.write( 'throughput: %.2f pages/s\n' % (len(results)/elapsed) )
+
+
+
+usage = 'Usage: batch.py {input directory or glob} {output directory} [{workers} [{engine} [templates]]]\n'
+
+if __name__ == '__main__':
+
+  if len(sys.argv) < 3:
+    sys.stderr.write( usage )
+    sys.exit(1)
+
+  numWorkers = int( sys.argv[3] ) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+  engine = sys.argv[4] if len(sys.argv) > 4 else 'array'
+  useTemplates = (len(sys.argv) > 5)
+
+  if engine not in [ 'array', 'peaks' ] or (useTemplates and sys.argv[5] != 'templates'):
+    sys.stderr.write( usage )
+    sys.exit(1)
+
+  processAll( sys.argv[1], sys.argv[2], numWorkers, engine, useTemplates )
@@ -0,0 +1,877 @@
+# Grid removal with whole-array operations
+#
+# This does the computation of compute() in main.py (steps 1 to 6
+# described above that function) with NumPy array operations, instead
+# of iterating over the image in Python.  The results are the same as
+# those of the loop implementation in compute(), but a full ECG page
+# takes a fraction of a second instead of minutes.
+#
+# Note that the loop implementation smooths the grid image in place,
+# so each pixel is smoothed with the already-smoothed pixels above it
+# and to its left.  That is reproduced in smoothGrid() below.
+#
+# The computation is done in stages, each of which keeps its last
+# result (see stage() below).  When removeGrid() is called again for
+# the same image with different parameters, only the stages that
+# depend on the changed parameters are done again.  The stages after
+# the threshold depend only on which FT components are kept, which is
+# found from the magnitudes in sorted order, so a change of threshold
+# that keeps the same components costs nothing.
+#
+# A threshold that keeps a different set of components does not do the
+# inverse FT, smoothing and gradient again in full either: as those
+# steps are linear, the kept smoothed grid and gradient of a previous
+# set are updated from the few components that were added or removed
+# (see "Updating the smoothed grid from changed components" below).
+# On an ECG page, that takes about 0.2 s instead of 0.45 s, most of it
+# in the fill of Step 6, which is done again.
+
+
+import math, time
+
+import numpy as np
+
+import filters, spectrum, peaks, templates
+
+
+# Remove the grid from 'image'.  Returns the half FTs (see spectrum.py)
+# of the image and of the grid, and gridImage, resultImage and lines,
+# as compute() stores and returns them.  Also returns the metrics of
+# the computation (see newMetrics() below).
+#
+# If 'usePeaks' is True, the lines are found from the local maxima of
+# the FT with peaks.py, instead of as compute() finds them.
+#
+# The parameters are those of compute(): the FT components with at
+# least 'threshold' of the max magnitude are kept as the grid, peaks
+# within 'minRadius' of the origin are ignored in finding the lines,
+# and pixels where the smoothed grid is > 'cutoff' are grid pixels.
+#
+# If 'useTemplates' is True, grid templates (see templates.py) are used
+# and added, so that pages with the same grid as an earlier one are
+# done more quickly.
+#
+# The FTs are not padded to fast sizes, since the peaks and the grid
+# image depend on the FT size.
+#
+# The image may be of any real type (e.g. uint8, as loadImage() gives)
+# or complex.  Only the FTs are complex: the grid image is float32, and
+# the result image is of resultType() of the image's type.
+#
+# The returned arrays are those kept by the stages, and so are the same
+# objects when they do not change.  They should not be modified.
+
+def removeGrid( image, usePeaks=False, threshold=0.4, cutoff=16, minRadius=6, useTemplates=False ):
+
+  startTime = time.perf_counter()
+
+  height, width = image.shape
+
+  metrics = newMetrics( height, width )
+
+  # Forward FT
+
+  imageHalfFT = stage( metrics, '1. compute FT', image, (), spectrum.halfFT, image )
+
+  # FT magnitudes (excluding the DC component)
+
+  mags, dc, maxMag = stage( metrics, '2. computing FT magnitudes', image, (), magnitudes, imageHalfFT )
+
+  minMag = threshold * maxMag
+
+  # If 'useTemplates', use the lines of a grid template that the image
+  # matches (see templates.py)
+
+  template = None
+
+  if useTemplates:
+    templateKey = (height, width, threshold, usePeaks, minRadius)
+    template = templates.findTemplate( templateKey, mags, width, minMag, metrics )
+
+  if template is not None:
+
+    # Keep the FT components with at least 'threshold' of the max
+    # magnitude (without sorting the magnitudes)
+
+    number, xs, ys, lines, templateGrid = template
+    numPeaks = len(xs)
+
+    keptKey  = ('threshold', threshold)
+    linesKey = keptKey + ('template', number)
+
+    keep, gridHalfFT = stage( metrics, '3. removing low-magnitude components (with grid template)', image, keptKey,
+                              keepComponents, imageHalfFT, dc, mags >= minMag )
+
+  else:
+
+    # Keep the FT components with at least 'threshold' of the max
+    # magnitude.  They are the last 'numKept' in sorted order.
+
+    sortedMags, order = stage( metrics, '2. sorting FT magnitudes', image, (), sortMagnitudes, mags )
+
+    numKept = sortedMags.size - np.searchsorted( sortedMags, minMag ) # (the number >= minMag)
+
+    keptKey  = (numKept,)
+    linesKey = keptKey + (usePeaks, minRadius)
+
+    keep, gridHalfFT = stage( metrics, '3. removing low-magnitude components', image, keptKey,
+                              keepLargest, imageHalfFT, dc, order, numKept )
+
+    # Find (angle, distance) to each peak
+
+    lines, numPeaks = stage( metrics, '4. finding angles and distances of grid lines', image, linesKey,
+                             gridLines, mags, keep, width, minMag, usePeaks, minRadius )
+
+  # If the smoothed grid and its gradient are kept for a set of
+  # components that differs from 'gridHalfFT' in only a few (or are in
+  # the template), update them from those (see "Updating the smoothed
+  # grid from changed components" below)
+
+  isKept = all( keptKey in keptResults( name, image ) for name in [ '6. smoothing grid', '6. grid gradient' ] )
+
+  if isKept:
+    base = None
+  elif template is not None:
+    base = gridBase( image, gridHalfFT, templateGrid )
+  else:
+    base = gridBase( image, gridHalfFT )
+
+  if base is None:
+
+    # Convert back to spatial domain to get a grid-like image (unless
+    # the later stages are kept, as they may have been updated)
+
+    if isKept:
+      gridImage = None
+    else:
+      gridImage = stage( metrics, '5. inverse FT', image, keptKey, spectrum.inverseHalfFT, gridHalfFT, width )
+
+    # Remove grid image from original image
+
+    smooth, gridImage = stage( metrics, '6. smoothing grid', image, keptKey, smoothedGrid, gridImage )
+    gradient = stage( metrics, '6. grid gradient', image, keptKey, gridGradient, smooth )
+
+    numChanged = 0
+
+  else:
+
+    baseHalfFT, baseSmooth, baseGradient = base
+
+    changes = stage( metrics, '5. inverse FT (of the changed components)', image, keptKey,
+                     changedComponents, gridHalfFT, baseHalfFT )
+
+    smooth, gridImage = stage( metrics, '6. smoothing grid', image, keptKey, updatedSmoothedGrid, baseSmooth, changes )
+    gradient = stage( metrics, '6. grid gradient', image, keptKey, updatedGradient, baseGradient, baseSmooth, smooth, changes )
+
+    numChanged = len( changes[0] )
+
+  # Remove grid image from original image
+
+  resultImage = stage( metrics, '6. remove grid', image, linesKey + (cutoff,),
+                       fillGrid, image, smooth, gradient, lines[0][0], lines[1][0], cutoff )
+
+  if useTemplates and template is None:
+    templates.addTemplate( templateKey, mags, width, minMag, minRadius, lines, (gridHalfFT, smooth, gradient) )
+
+  print( 'done' )
+
+  metrics['keptComponents']    = int( np.count_nonzero( keep ) )
+  metrics['changedComponents'] = int( numChanged )
+  metrics['peaks']             = int( numPeaks )
+  metrics['gridPixels']        = int( np.count_nonzero( smooth > cutoff ) )
+  metrics['template']          = template is not None
+
+  finishMetrics( metrics, time.perf_counter() - startTime )
+
+  return imageHalfFT, gridHalfFT, gridImage, resultImage, lines, metrics
+
+
+# The results of each stage of removeGrid() for the last image, as
+# name -> (image, { key: result }), with the results for at most
+# 'maxStageResults' keys (the most recently used) kept for each stage
+
+stageResults = {}
+
+maxStageResults = 4
+
+
+# Return the results kept for the stage 'name' for 'image', as
+# { key: result }
+
+def keptResults( name, image ):
+
+  if name in stageResults and stageResults[name][0] is image:
+    return stageResults[name][1]
+
+  return {}
+
+
+# Return the result of the stage 'name' for 'image'.  If the stage has
+# a result for the same image and the same 'key' (a tuple of the
+# parameters on which the stage and the stages before it depend), that
+# is returned.  Otherwise, the stage's name is printed and the result
+# is found as function(*args).  The time taken and the size of the
+# result are added to 'metrics'.
+#
+# So going back and forth between a few values of a parameter does not
+# compute anything again.  The results for a previous image are
+# dropped, so only one image's results are kept.
+
+def stage( metrics, name, image, key, function, *args ):
+
+  startTime = time.perf_counter()
+
+  if name not in stageResults or stageResults[name][0] is not image:
+    stageResults[name] = (image, {})
+
+  results = stageResults[name][1]
+
+  reused = key in results
+
+  if reused:
+    result = results.pop( key ) # (and put it back below, as the most recent)
+  else:
+    print( name )
+    result = function( *args )
+
+  results[key] = result
+
+  if len(results) > maxStageResults:
+    del results[ next( iter( results ) ) ] # (the least recently used)
+
+  metrics['stages'].append( { 'name': name,
+                              'ms': (time.perf_counter() - startTime) * 1000,
+                              'bytes': 0 if reused else resultBytes( result ),
+                              'reused': reused } )
+
+  return result
+
+
+# Metrics of removeGrid()
+#
+# The metrics are a dict (which can be written as JSON) with
+#
+#   height, width    the image size
+#   stages           for each stage done, in order: its name, the time
+#                    taken in ms, the bytes of arrays in its result (0
+#                    if the result was kept from before) and whether
+#                    the result was kept from before
+#   stepMs           the time in ms of each of steps 1 to 6 of
+#                    compute(), i.e. of the stages with that number
+#   stepBytes        the bytes of arrays allocated in each step
+#   totalMs          the time of the whole removeGrid() in ms
+#   keptComponents   the number of FT components kept as the grid
+#   changedComponents
+#                    the number of changed components from which the
+#                    smoothed grid was updated (see "Updating the
+#                    smoothed grid" below), or 0 if it was found in full
+#   peaks            the number of FT peaks (or, for the lines found as
+#                    compute() finds them, kept components) from which
+#                    the lines were found
+#   gridPixels       the number of grid pixels that were filled
+#   template         whether a grid template was used
+#   templateRejects  the number of grid templates whose magnitudes were
+#                    above the threshold, but which were rejected as
+#                    the page's peaks were not at their positions
+#
+# stepReport() makes a table of them, and addMetrics() adds those of
+# one tile to those of the others (without the stages).
+
+stepNames = [ '1. compute FT',
+              '2. computing FT magnitudes',
+              '3. removing low-magnitude components',
+              '4. finding angles and distances of grid lines',
+              '5. inverse FT',
+              '6. remove grid' ]
+
+countNames = [ 'keptComponents', 'changedComponents', 'peaks', 'gridPixels', 'templateRejects' ]
+
+
+def newMetrics( height, width ):
+
+  metrics = { 'height': height, 'width': width, 'stages': [],
+              'stepMs': [ 0.0 ] * len(stepNames), 'stepBytes': [ 0 ] * len(stepNames),
+              'totalMs': 0.0, 'template': False }
+
+  for name in countNames:
+    metrics[name] = 0
+
+  return metrics
+
+
+# Add the times and sizes of the stages to those of their steps, and
+# set the total time (given in seconds)
+
+def finishMetrics( metrics, seconds ):
+
+  for stageMetrics in metrics['stages']:
+    step = int( stageMetrics['name'].split( '.' )[0] ) - 1
+    metrics['stepMs'][step]    += stageMetrics['ms']
+    metrics['stepBytes'][step] += stageMetrics['bytes']
+
+  metrics['totalMs'] = seconds * 1000
+
+
+# Add the step times and sizes and the counts of 'metrics' to those of
+# 'total' (e.g. for tiles)
+
+def addMetrics( total, metrics ):
+
+  for name in [ 'stepMs', 'stepBytes' ]:
+    total[name] = [ a+b for a, b in zip( total[name], metrics[name] ) ]
+
+  for name in countNames:
+    total[name] += metrics[name]
+
+
+# Return the step with the most time, and its fraction of the time of
+# all steps
+
+def slowestStep( metrics ):
+
+  stepMs = metrics['stepMs']
+  step   = stepMs.index( max( stepMs ) )
+
+  return stepNames[step], stepMs[step] / max( sum( stepMs ), 1e-9 )
+
+
+# Return a table of the step times and sizes, and the counts, as a string
+
+def stepReport( metrics ):
+
+  report = [ '  %-46s %9s %9s' % ('step', 'ms', 'MB') ]
+
+  for name, ms, numBytes in zip( stepNames, metrics['stepMs'], metrics['stepBytes'] ):
+    report.append( '  %-46s %9.1f %9.1f' % (name, ms, numBytes / 1e6) )
+
+  report.append( '  %-46s %9.1f' % ('total', metrics['totalMs']) )
+  report.append( '  ' + ', '.join( '%s %d' % (name, metrics[name]) for name in countNames ) )
+
+  return '\n'.join( report )
+
+
+# The number of bytes in the arrays of a stage's result (which may be
+# an array, or a tuple or list containing arrays)
+
+def resultBytes( result ):
+
+  if isinstance( result, np.ndarray ):
+    return result.nbytes
+  elif isinstance( result, (tuple,list) ):
+    return sum( resultBytes( item ) for item in result )
+  else:
+    return 0
+
+
+# Return the magnitudes of the half FT, with that of the DC component
+# set to 0, the DC magnitude and the max magnitude
+
+def magnitudes( imageHalfFT ):
+
+  mags = np.absolute( imageHalfFT )
+  dc = mags[0,0]
+  mags[0,0] = 0
+
+  return mags, dc, mags.max()
+
+
+# Return the magnitudes in increasing order, and the (flat) indices of
+# that order
+
+def sortMagnitudes( mags ):
+
+  order = np.argsort( mags, axis=None )
+
+  return mags.flat[order], order
+
+
+# Keep the components of the half FT marked in 'keep', and the DC
+# component with its magnitude 'dc' (as compute() does).  Returns
+# 'keep' and the grid's half FT.
+
+def keepComponents( imageHalfFT, dc, keep ):
+
+  gridHalfFT = np.where( keep, imageHalfFT, 0 )
+  gridHalfFT[0,0] = dc
+
+  return keep, gridHalfFT
+
+
+# Keep the components of the half FT that are last 'numKept' in
+# 'order', as keepComponents() does
+
+def keepLargest( imageHalfFT, dc, order, numKept ):
+
+  keep = np.zeros( imageHalfFT.shape, bool )
+  keep.flat[ order[order.size-numKept:] ] = True
+
+  return keepComponents( imageHalfFT, dc, keep )
+
+
+# Find the lines from the kept components 'keep', which are those with
+# magnitudes in 'mags' of at least 'minMag'.  Returns the lines and the
+# number of peaks (or kept components) they were found from.
+
+def gridLines( mags, keep, width, minMag, usePeaks, minRadius ):
+
+  lines = None
+
+  if usePeaks:
+    found = peaks.findPeaks( mags, width, minMag, minRadius )
+    lines = peaks.findLines( found )
+    numPeaks = len(found)
+
+  if lines is None: # (also if the peaks are not in two directions)
+    ys, xs = np.nonzero( spectrum.fullFT( keep, width ) ) # (in the same order as the loops visit them)
+    lines = findLines( xs, ys, width, mags.shape[0], minRadius )
+    numPeaks = len(xs)
+
+  return lines, numPeaks
+
+
+# Find the angles and distances of the two principal grid lines from
+# the (x,y) locations of the FT peaks.  As in compute(), the first
+# peak sets the angle of the first line, and each other peak at more
+# than 'minRadius' pixels from the origin belongs to the first line if
+# its angle is within 45 degrees of that, or to the second line
+# otherwise.
+
+def findLines( xs, ys, width, height, minRadius=6 ):
+
+  # correct coordinates to match fft quadrants
+
+  u = np.where( xs >= width/2,  xs-width,  xs )
+  v = np.where( ys >= height/2, ys-height, ys )
+
+  ratio = width / height
+
+  angles = np.array( [ math.atan2( vk*ratio, uk ) for uk, vk in zip(u,v) ] ) # (as the loops compute them; there are few peaks)
+  dists  = np.sqrt( u*u + v*v )
+
+  firstAngle = angles[0]
+
+  angles = angles[1:]
+  dists  = dists[1:]
+
+  far = (dists > minRadius)
+  angles = angles[far]
+  dists  = dists[far]
+
+  angles = np.where( angles < 0, angles + math.pi, np.where( angles > 3.14, angles - math.pi, angles ) )
+
+  onLine1 = (np.absolute( firstAngle - angles ) < math.pi/4)
+
+  line1Angles = [firstAngle] + angles[onLine1].tolist()
+  line2Angles = angles[~onLine1].tolist()
+
+  angle1 = (sum(line1Angles)/len(line1Angles))/(2*math.pi)*360
+  angle2 = (sum(line2Angles)/len(line2Angles))/(2*math.pi)*360
+
+  return [ (angle1, dists[onLine1].min()), (angle2, dists[~onLine1].min()) ]
+
+
+# Smooth the grid image with the 5x5 Gaussian G5, in place, as the
+# loops in compute() do.
+#
+# Pixel (x,y) is smoothed with the original values of the pixels at
+# and after it, and with the smoothed values of the two rows above it
+# and the two pixels to its left.  The part from the original values
+# is found for all rows at once.  Then, a row at a time, the part from
+# the two smoothed rows above is added and the row is run through the
+# recursive filter s[x] = c[x] + 24/256 s[x-1] + 6/256 s[x-2] for the
+# two pixels to the left.  The recursive filter is applied as a
+# convolution with its impulse response, which falls below 1e-17 of
+# its first value after 'iirTaps' terms.
+
+g5 = np.array( [1,4,6,4,1] ) / 16 # G5 is the outer product of this with itself
+
+iirTaps = 32
+
+iirResponse = np.zeros( iirTaps )
+iirResponse[0] = 1
+iirResponse[1] = g5[2]*g5[1]
+for k in range(2,iirTaps):
+  iirResponse[k] = g5[2]*g5[1] * iirResponse[k-1] + g5[2]*g5[0] * iirResponse[k-2]
+
+afterG5 = np.outer( g5, g5 ) # the part of G5 for the original values
+afterG5[:2,:] = 0
+afterG5[2,:2] = 0
+
+
+def smoothGrid( grid ):
+
+  height, width = grid.shape
+
+  # zero-padded by two pixels, and smoothed in place
+
+  padded = np.zeros( (height+4,width+4) )
+  padded[2:-2,2:-2] = grid
+
+  # part from the original values
+
+  after = filters.filterImage( grid, afterG5 )
+
+  # add the part from the smoothed values, a row at a time
+
+  for y in range(height):
+
+    above = g5[0] * padded[y] + g5[1] * padded[y+1] # (the two rows above, both smoothed)
+
+    row = after[y] + np.convolve( above, g5, 'valid' )
+
+    padded[y+2,2:-2] = np.convolve( row, iirResponse )[:width]
+
+  return padded[2:-2,2:-2]
+
+
+# Return the smoothed grid image, and a float32 copy of it to show
+
+def smoothedGrid( gridImage ):
+
+  smooth = smoothGrid( gridImage )
+
+  return smooth, smooth.astype( np.float32 )
+
+
+# Set each grid pixel (where the smoothed grid is > 'cutoff') of
+# 'image' to the average of the nearest non-grid pixels on either side
+# of the grid line, as compute() and getPixel() do.  'gradient' is the
+# gradient of the smoothed grid, from gridGradient().  'angle1' and
+# 'angle2' are the grid line angles in degrees.  Returns the new image.
+
+sobelX = [[-1,0,1],
+          [-2,0,2],
+          [-1,0,1]]
+
+sobelY = [[1,2,1],
+          [0,0,0],
+          [-1,-2,-1]]
+
+
+def gridGradient( smooth ):
+
+  return filters.filterImage( smooth, sobelX ), filters.filterImage( smooth, sobelY )
+
+
+# Updating the smoothed grid from changed components
+#
+# The inverse FT, smoothGrid() and gridGradient() are all linear.  So
+# when the kept components change, the smoothed grid and its gradient
+# are those for the previous components plus those of the grid made by
+# the changed components alone (the added ones, less the removed ones).
+# A step of the threshold usually changes only a few components (e.g.
+# 8 of 51 from 0.4 to 0.5 on an ECG page).  For a page that matches a
+# grid template, the smoothed grid and gradient are updated from those
+# of the template's page: all of the kept components change, but there
+# are only about 50, and that takes about 0.17 s instead of 0.31 s.
+#
+# Each component of the half FT is a 2D wave in the grid image.  Away
+# from the edges of the image, smoothGrid() multiplies a wave by a
+# constant, its frequency response (see waveResponses()), and the
+# Sobel kernels of gridGradient() multiply that by theirs.  So the
+# change there is a sum of a few waves, found as the product of a
+# height x n and an n x width matrix for n changed components.
+#
+# Near the edges, where the zero padding and the start of the
+# recursion in smoothGrid() matter, the change is found by running
+# smoothGrid() and the Sobel kernels on strips of the changed grid.
+# The effects of the edges fall below round-off within 'edgeBand'
+# pixels (except at the bottom, which only affects the last two rows),
+# so the strips are that wide, plus as much again so that their own
+# inner edges have no effect.  The results agree with those found in
+# full to round-off (about 1e-13), so the same pixels are grid pixels.
+#
+# The smoothed grid is updated only from kept components that differ
+# in at most 'maxChangedComponents' from the new ones, and only for
+# images of at least 'minUpdateSize' on each side.
+
+edgeBand = 48
+
+maxChangedComponents = 64
+
+minUpdateSize = 6 * edgeBand
+
+
+# Return the grid half FT, smoothed grid and gradient kept for 'image'
+# (or in 'templateGrid', those of a grid template) that are closest to
+# 'gridHalfFT', as (gridHalfFT, smooth, gradient), or None if there
+# are none with at most 'maxChangedComponents' changed
+
+def gridBase( image, gridHalfFT, templateGrid=None ):
+
+  if min( image.shape ) < minUpdateSize:
+    return None
+
+  smoothings = keptResults( '6. smoothing grid', image )
+  gradients  = keptResults( '6. grid gradient', image )
+
+  kept = dict( keptResults( '3. removing low-magnitude components', image ) )
+  kept.update( keptResults( '3. removing low-magnitude components (with grid template)', image ) )
+
+  bases = [ (kept[key][1], smoothings[key][0], gradients[key]) for key in smoothings if key in gradients and key in kept ]
+
+  if templateGrid is not None:
+    bases.append( templateGrid )
+
+  best = None
+
+  for base in bases:
+
+    numChanged = np.count_nonzero( base[0] != gridHalfFT )
+
+    if numChanged <= maxChangedComponents and (best is None or numChanged < best[0]):
+      best = (numChanged,) + base
+
+  return None if best is None else best[1:]
+
+
+# Return the rows 'vs' and columns 'us' of the components that differ
+# between the grid half FTs 'gridHalfFT' and 'baseHalfFT' (those kept
+# in only one of them, or for a template, with different values), and
+# the differences of their values
+
+def changedComponents( gridHalfFT, baseHalfFT ):
+
+  vs, us = np.nonzero( gridHalfFT != baseHalfFT )
+
+  return vs, us, gridHalfFT[vs,us] - baseHalfFT[vs,us]
+
+
+# Return the sum over the image rows 'ys' and columns 'xs' of the waves
+# of the half FT components at rows 'vs' and columns 'us' with the
+# given 'values', as np.fft.irfft2() finds them.  (So each component
+# stands for itself and its conjugate at (-v,-u), except in the first
+# column and, for an even width, the last.)
+
+def sumWaves( vs, us, values, ys, xs, height, width ):
+
+  weights = np.where( (us == 0) | (2*us == width), 1, 2 ) / (height*width)
+
+  rows    = np.exp( 2j*math.pi * (np.outer( ys, vs ) % height) / height ) * (weights * values) # (the products are taken
+  columns = np.exp( 2j*math.pi * (np.outer( us, xs ) % width) / width )                       #  mod the size to keep them exact)
+
+  return np.dot( rows.real, columns.real ) - np.dot( rows.imag, columns.imag )
+
+
+# Return the frequency responses of smoothGrid() and of the Sobel
+# kernels of gridGradient() after smoothGrid(), away from the edges of
+# the image, for the waves of the half FT components at rows 'vs' and
+# columns 'us'.
+#
+# A wave w(x,y) is multiplied by a kernel's response, the sum of each
+# kernel entry times the wave's factor for the entry's offset from the
+# centre.  smoothGrid() adds the response of 'afterG5' to those of G5's
+# first two rows on the two rows above and of the recursion on the two
+# pixels to the left, each times the response of smoothGrid() itself.
+
+def waveResponses( vs, us, height, width ):
+
+  wx = np.exp( 2j*math.pi * us / width  ) # (the wave's factor for a step of one pixel in x,
+  wy = np.exp( 2j*math.pi * vs / height ) #  and in y)
+
+  def response( kernel ): # (for a kernel centred as in filters.filterImage())
+    kernel = np.array( kernel, np.float64 )
+    kh, kw = kernel.shape
+    return sum( kernel[i,j] * wy**(i - kh//2) * wx**(j - kw//2) for i, j in zip( *np.nonzero( kernel ) ) )
+
+  after = response( afterG5 )
+  above = response( [g5] ) * (g5[0] / wy**2 + g5[1] / wy)
+  left  = g5[2]*g5[1] / wx + g5[2]*g5[0] / wx**2
+
+  smooth = after / (1 - above - left)
+
+  return smooth, smooth * response( sobelX ), smooth * response( sobelY )
+
+
+# Return the smoothed grid updated from 'baseSmooth' with the changed
+# components 'changes' (from changedComponents()), and a float32 copy
+# of it to show, as smoothedGrid() does
+
+def updatedSmoothedGrid( baseSmooth, changes ):
+
+  height, width = baseSmooth.shape
+
+  vs, us, values = changes
+
+  ys = np.arange( height )
+  xs = np.arange( width )
+  b  = edgeBand
+
+  change = sumWaves( vs, us, values * waveResponses( vs, us, height, width )[0], ys, xs, height, width )
+
+  # near the edges, smooth strips of the changed grid
+
+  def smoothedStrip( stripYs, stripXs ):
+    return smoothGrid( sumWaves( vs, us, values, stripYs, stripXs, height, width ) )
+
+  change[:b]  = smoothedStrip( ys[:b+2],  xs )[:b] # (the last two rows are affected by the strip's bottom edge)
+  change[-2:] = smoothedStrip( ys[-b-2:], xs )[-2:]
+
+  # (the left and right strips as one image, with 'b' zero columns between them)
+
+  sides = smoothGrid( np.hstack( (sumWaves( vs, us, values, ys, xs[:2*b], height, width ),
+                                  np.zeros( (height,b) ),
+                                  sumWaves( vs, us, values, ys, xs[-2*b:], height, width )) ) )
+
+  change[:,:b]  = sides[:,:b]
+  change[:,-b:] = sides[:,-b:]
+
+  smooth = baseSmooth + change
+
+  return smooth, smooth.astype( np.float32 )
+
+
+# Return the gradient of 'smooth', updated from 'baseGradient', the
+# gradient of 'baseSmooth', with the changed components 'changes'
+
+def updatedGradient( baseGradient, baseSmooth, smooth, changes ):
+
+  height, width = smooth.shape
+
+  vs, us, values = changes
+
+  ys = np.arange( height )
+  xs = np.arange( width )
+  b  = edgeBand
+
+  smoothResponse, xResponse, yResponse = waveResponses( vs, us, height, width )
+
+  gradient = []
+
+  for baseComponent, kernel, response in [ (baseGradient[0], sobelX, xResponse), (baseGradient[1], sobelY, yResponse) ]:
+
+    change = sumWaves( vs, us, values * response, ys, xs, height, width )
+
+    # near the edges, apply the kernel to the change of the smoothed
+    # grid (which is exact there)
+
+    change[:b+1]    = filters.filterImage( smooth[:b+2]    - baseSmooth[:b+2],    kernel )[:b+1]
+    change[-3:]     = filters.filterImage( smooth[-4:]     - baseSmooth[-4:],     kernel )[-3:]
+    change[:,:b+1]  = filters.filterImage( smooth[:,:b+2]  - baseSmooth[:,:b+2],  kernel )[:,:b+1]
+    change[:,-b-1:] = filters.filterImage( smooth[:,-b-2:] - baseSmooth[:,-b-2:], kernel )[:,-b-1:]
+
+    gradient.append( baseComponent + change )
+
+  return tuple( gradient )
+
+
+def fillGrid( image, smooth, gradient, angle1, angle2, cutoff=16 ):
+
+  isGrid = (smooth > cutoff)
+
+  ys, xs = np.nonzero( isGrid )
+
+  # gradient direction (in degrees) at the grid pixels
+
+  Gx, Gy = gradient
+
+  gradDir = (np.arctan2( Gy[ys,xs], Gx[ys,xs] ) / (2*math.pi)) * 360
+
+  # use the line whose angle is closest to perpendicular to the gradient
+
+  a1diff = np.absolute( angle1 - gradDir )
+  a2diff = np.absolute( angle2 - gradDir )
+
+  a1diff = np.where( a1diff > 180, a1diff - 180, a1diff )
+  a2diff = np.where( a2diff > 180, a2diff - 180, a2diff )
+
+  onLine1 = (np.absolute( a1diff - 90 ) < np.absolute( a2diff - 90 ))
+
+  # average the nearest non-grid pixels on either side
+
+  sides = sidePixels( xs, ys, np.where( onLine1, 0, 1 ), stepTable( angle1, angle2 ), isGrid, image )
+
+  resultImage = image.astype( resultType( image.dtype ) )
+  resultImage[ys,xs] = (sides[:,0] + sides[:,1])/2
+
+  return resultImage
+
+
+# The type of a result image for an image of type 'dtype': float32 for
+# integer types (so the averages of two pixels are exact), or 'dtype'
+# if it is a wider float or complex type.
+
+def resultType( dtype ):
+
+  return np.result_type( dtype, np.float32 )
+
+
+# Steps to the pixels at distances d = 1 to 4 on either side of each
+# grid line, rounded exactly as getPixel() rounds them.  Returns dx and
+# dy, each indexed by [line,side,d-1], where side 0 is along the line's
+# angle and side 1 along the angle + 180.  These are computed once for
+# all grid pixels.
+
+def stepTable( angle1, angle2 ):
+
+  dx = np.zeros( (2,2,4), int )
+  dy = np.zeros( (2,2,4), int )
+
+  for line, angle in enumerate( [angle1, angle2] ):
+    for side in range(2):
+      for d in range(1,5):
+        dx[line,side,d-1], dy[line,side,d-1] = stepOffset( angle + 180*side, d )
+
+  return dx, dy
+
+
+# For each grid pixel (xs[k],ys[k]) on grid line lines[k] (0 or 1), step
+# up to 4 pixels to each side of the line (as in 'steps', from
+# stepTable()) to find the first non-grid pixel (where 'isGrid' is
+# False), and return its value in 'image'.  The value is 0 if the steps
+# leave the image before such a pixel, or find none.
+#
+# The image and a code for each pixel (0 for grid, 1 for non-grid and
+# 2 for outside the image) are padded by 4 pixels and flattened, so
+# that each step is a fixed offset in the flat arrays.  The steps are
+# then taken for all grid pixels of a line and side at once, from the
+# furthest back to the nearest, each replacing the value found unless
+# it is at a grid pixel.  Returns an array indexed by [k,side].
+
+def sidePixels( xs, ys, lines, steps, isGrid, image ):
+
+  height, width = image.shape
+
+  dx, dy = steps
+
+  pad = 4
+  paddedWidth = width + 2*pad
+
+  codes = np.full( (height+2*pad, paddedWidth), 2, np.uint8 )
+  codes[pad:-pad,pad:-pad] = ~isGrid
+
+  values = np.zeros( codes.shape, resultType( image.dtype ) ) # (so that two can be added)
+  values[pad:-pad,pad:-pad] = image
+
+  codes  = codes.ravel()
+  values = values.ravel()
+
+  offsets = dy * paddedWidth + dx # indexed by [line,side,d-1]
+  starts  = (ys + pad) * paddedWidth + (xs + pad)
+
+  sides = np.zeros( (len(xs),2), values.dtype )
+
+  for line in range(2):
+
+    onLine = np.flatnonzero( lines == line )
+    lineStarts = starts[onLine]
+
+    for side in range(2):
+
+      found = np.zeros( len(onLine), values.dtype )
+
+      for d in range(3,-1,-1):
+        index = lineStarts + offsets[line,side,d]
+        code  = np.take( codes, index )
+        found = np.where( code == 0, found, np.where( code == 1, np.take( values, index ), 0 ) )
+
+      sides[onLine,side] = found
+
+  return sides
+
+
+def stepOffset( angle, d ):
+
+  angle_rad = angle * math.pi / 180
+
+  return round( d * math.cos(angle_rad) ), round( d * math.sin(angle_rad) )
@@ -0,0 +1,167 @@
+# Filtering of whole images
+#
+# filterImage() applies a kernel to every pixel of an image, as
+# applyFilter() in main.py does for one pixel: the result at (x,y) is
+# the sum over the kernel of
+#
+#     kernel[i][j] * image[ y - kh//2 + i ][ x - kw//2 + j ]
+#
+# for a kernel of kh rows and kw columns.  Pixels outside the image
+# are found according to 'border':
+#
+#     'zero'    they are 0 (as in applyFilter())
+#     'mirror'  the image is reflected about its edge pixels
+#     'wrap'    the image repeats (as it does for the FT)
+#
+# The kernel is applied in one of three ways:
+#
+#   - A separable kernel (one that is the outer product of a column
+#     and a row, like G3, G5 and the Sobel kernels) is applied as two
+#     1D passes, down the columns and then along the rows.
+#
+#   - A small kernel that is not separable is applied directly, by
+#     summing shifted copies of the image, one per non-zero entry.
+#
+#   - A kernel with more than 'maxDirectTaps' non-zero entries that is
+#     not separable is applied by multiplying FTs.
+
+
+import numpy as np
+
+import spectrum
+
+
+maxDirectTaps = 49
+
+borderModes = { 'zero': 'constant', 'mirror': 'reflect', 'wrap': 'wrap' } # (as np.pad names them)
+
+
+# Apply 'kernel' (a 2D list or array) to 'image' with the given
+# border handling.  Returns the filtered image.
+
+def filterImage( image, kernel, border='zero' ):
+
+  kernel = np.array( kernel, np.float64 )
+
+  padded = padImage( image, kernel.shape, border )
+
+  factors = separate( kernel )
+
+  if factors is not None:
+    column, row = factors
+    return correlateRows( correlateColumns( padded, column ), row )
+  elif np.count_nonzero( kernel ) <= maxDirectTaps:
+    return correlateDirect( padded, kernel )
+  else:
+    return correlateFT( padded, kernel )
+
+
+# Pad 'image' on all sides by the amount that a kernel of shape
+# 'kernelShape' reaches beyond it
+
+def padImage( image, kernelShape, border ):
+
+  if border not in borderModes:
+    raise ValueError( "border '%s' not understood" % border )
+
+  kh, kw = kernelShape
+
+  return np.pad( image, ((kh//2, kh-1-kh//2), (kw//2, kw-1-kw//2)), borderModes[border] )
+
+
+# If 'kernel' is the outer product of a column and a row, return
+# (column, row).  Otherwise, return None.
+
+def separate( kernel ):
+
+  i, j = np.unravel_index( np.argmax( np.absolute( kernel ) ), kernel.shape )
+
+  if kernel[i,j] == 0:
+    return None
+
+  column = kernel[:,j]
+  row    = kernel[i,:] / kernel[i,j]
+
+  if np.allclose( np.outer( column, row ), kernel, rtol=1e-12, atol=0 ):
+    return column, row
+  else:
+    return None
+
+
+# Correlate the columns of 'padded' with the 1D 'weights', keeping only
+# the rows where the weights fit entirely in the array
+
+def correlateColumns( padded, weights ):
+
+  height = padded.shape[0] - len(weights) + 1
+
+  result = None
+
+  for i in np.flatnonzero( weights ):
+    term = weights[i] * padded[i:i+height]
+    result = term if result is None else result + term
+
+  return result
+
+
+# Correlate the rows of 'padded' with the 1D 'weights', keeping only
+# the columns where the weights fit entirely in the array
+
+def correlateRows( padded, weights ):
+
+  width = padded.shape[1] - len(weights) + 1
+
+  result = None
+
+  for j in np.flatnonzero( weights ):
+    term = weights[j] * padded[:,j:j+width]
+    result = term if result is None else result + term
+
+  return result
+
+
+# Correlate 'padded' with the 2D 'kernel', one shifted copy per non-zero
+# kernel entry
+
+def correlateDirect( padded, kernel ):
+
+  kh, kw = kernel.shape
+
+  height = padded.shape[0] - kh + 1
+  width  = padded.shape[1] - kw + 1
+
+  result = np.zeros( (height,width), np.result_type( padded, kernel ) )
+
+  for i, j in zip( *np.nonzero( kernel ) ):
+    result += kernel[i,j] * padded[i:i+height,j:j+width]
+
+  return result
+
+
+# Correlate 'padded' with the 2D 'kernel' by multiplying their FTs.
+# The product gives a circular convolution, which is the correlation
+# wherever the kernel fits entirely in the padded array.  The FTs are
+# zero-padded to 5-smooth sizes, which makes them faster without
+# changing that part.  The kernel is real, so a complex image is
+# correlated as its real and imaginary parts, and the FTs are all half
+# FTs (see spectrum.py).
+
+def correlateFT( padded, kernel ):
+
+  if np.iscomplexobj( padded ):
+    return correlateFT( padded.real, kernel ) + 1j * correlateFT( padded.imag, kernel )
+
+  kh, kw = kernel.shape
+
+  height = padded.shape[0] - kh + 1
+  width  = padded.shape[1] - kw + 1
+
+  shape = ( spectrum.fastSize( padded.shape[0] ), spectrum.fastSize( padded.shape[1] ) )
+
+  flipped = kernel[::-1,::-1]
+
+  product = spectrum.halfFT( padded, shape ) * spectrum.halfFT( flipped, shape )
+
+  result = spectrum.inverseHalfFT( product, shape[1] )
+
+  return result[kh-1:kh-1+height,kw-1:kw-1+width]
@@ -7,7 +7,7 @@
 # DO NOT IMPORT OR USE ANY ADDITIONAL LIBRARIES.
 
 
-import sys, os, math
+import sys, os, math, json
 
 try: # NumPy
   import numpy as np
@@ -21,19 +21,36 @@ except:
   print( 'Error: Pillow has not been installed.' )
   sys.exit(0)
 
-try: # PyOpenGL
-  #from OpenGL.GLUT import *
-  from OpenGL.GL import *
-  from OpenGL.GLU import *
-except:
-  print( 'Error: PyOpenGL has not been installed.' )
-  sys.exit(0)
+import degrid   # grid removal with array operations
+import spectrum # FTs of real images
+import tiles    # grid removal in overlapping tiles
 
-try: # GLFW
-  import glfw
-except:
-  print( 'Error: GLFW has not been installed.' )
-  sys.exit(0)
+from pages import loadImage, outputImage # loading and output of images (without OpenGL, for batch.py)
+
+
+# PyOpenGL and GLFW are imported by importGUI() when the interactive
+# session starts, not here, so that compute() can be imported (e.g. by
+# validate.py) quickly and without them.
+
+def importGUI():
+
+  global glfw
+
+  try: # PyOpenGL
+    #import OpenGL.GLUT
+    import OpenGL.GL, OpenGL.GLU
+  except:
+    print( 'Error: PyOpenGL has not been installed.' )
+    sys.exit(0)
+
+  for module in [ OpenGL.GL, OpenGL.GLU ]: # (as 'from OpenGL.GL import *' would)
+    globals().update( { name : value for name, value in vars(module).items() if not name.startswith('_') } )
+
+  try: # GLFW
+    import glfw
+  except:
+    print( 'Error: GLFW has not been installed.' )
+    sys.exit(0)
 
 
 # Globals
@@ -44,7 +61,7 @@ windowHeight =  800*x
 showMagnitude = True            # for the FT, show the magnitude.  Otherwise, show the phase
 doHistoEq = False               # do histogram equalization on the FT to make features more obvious
 
-texID = None                    # for OpenGL
+panelTextures = {}              # for OpenGL: (row,col) -> (texture ID, (width,height), pixels in texture)
 
 zoom = 1.0                      # amount by which to zoom images
 translate = (0.0,0.0)           # amount by which to translate images
@@ -64,6 +81,20 @@ gridImageFT = None              # the grid's FT
 
 resultImage = None              # the final image
 
+computeEngine = 'array'         # 'array' or 'peaks' to use degrid.py, or 'loop' for the loop implementation in compute()
+computeEngines = [ 'array', 'peaks', 'loop' ]
+
+tileSize    = None              # if not None, the 'peaks' and 'array' engines work in overlapping tiles of this size (see tiles.py)
+tileOverlap = 128               # overlap of the tiles
+tileWorkers = os.cpu_count() or 1  # number of processes for the tiles
+
+gridThreshold = 0.4             # FT components with at least this fraction of the max magnitude are the grid (change with '[' and ']')
+gridCutoff    = 16              # pixels where the smoothed grid is above this are grid pixels
+dcRadius      = 6               # FT peaks within this distance of the origin are not grid lines
+
+computeMetrics = None           # metrics of the last compute() with degrid.py or tiles.py (see degrid.newMetrics())
+metricsLog     = None           # if a file name, the metrics of each such compute() are added to it as a line of JSON
+
 
 # Remove the grid from the global 'image'.  Return the result image
 # AND a list of [ [angle1,distance1], [angle2,distance2] ] describing
@@ -132,11 +163,54 @@ resultImage = None              # the final image
 # In the compute() function below, you should always iterate over the
 # image in your own code, rather than call some NumPy function to do
 # the iteration for you.
+#
+# If 'computeEngine' is 'array', the same computation is done instead
+# by degrid.removeGrid(), with array operations.  That gives the same
+# results in well under a second for a full ECG page.  If it is
+# 'peaks', degrid.removeGrid() finds the grid lines in Step 4 from the
+# local maxima of the FT (with peaks.py), which is more robust on noisy
+# scans but can give slightly different lines and results from the
+# loop implementation.  'array' is the default, so that the results
+# are those of the loop implementation.  (Cycle through the engines
+# with 'e'.)
+#
+# If 'tileSize' is set (toggle it with 't'), those engines remove the
+# grid separately in overlapping tiles of the image, with tiles.py,
+# which handles grids that vary across the page.  There is then no FT
+# of the whole image, so 'imageFT' and 'gridImageFT' are None.
+#
+# The 40% threshold, the grid pixel value of 16 and the distance of 6
+# from the origin below are 'gridThreshold', 'gridCutoff' and
+# 'dcRadius'.  degrid.removeGrid() keeps the results of its stages, so
+# when one of these is changed (e.g. with '[' and ']' for the
+# threshold), only the later stages are done again.  (For a threshold
+# that keeps different FT components, the smoothed grid is updated from
+# the changed components, and the fill of Step 6 is done again; see
+# degrid.py.)
+#
+# Those engines also print the time and memory of each step, and store
+# them (with counts of the peaks and grid pixels) in 'computeMetrics'.
 
 
 def compute():
 
-  global image, imageFT, gridImage, gridImageFT, resultImage
+  global image, imageFT, gridImage, gridImageFT, resultImage, computeMetrics
+
+  if computeEngine != 'loop' and tileSize is not None:
+    gridImage, resultImage, lines, tileLines, computeMetrics = tiles.removeGridTiled( image, tileSize, tileOverlap, tileWorkers, computeEngine == 'peaks',
+                                                                                      gridThreshold, gridCutoff, dcRadius )
+    imageFT = gridImageFT = None
+    reportMetrics()
+    return resultImage, lines
+
+  if computeEngine != 'loop':
+    imageHalfFT, gridHalfFT, gridImage, resultImage, lines, computeMetrics = degrid.removeGrid( image, computeEngine == 'peaks',
+                                                                                                gridThreshold, gridCutoff, dcRadius )
+    imageFT     = fullFT( imageHalfFT, imageFT )
+    gridImageFT = fullFT( gridHalfFT, gridImageFT )
+    shownFTs[:] = [ (imageHalfFT, imageFT), (gridHalfFT, gridImageFT) ]
+    reportMetrics()
+    return resultImage, lines
 
   height = image.shape[0]
   width  = image.shape[1]
@@ -164,11 +238,13 @@ def compute():
 
   print( '3. removing low-magnitude components' )
 
-  if gridImageFT is None:
-    gridImageFT = np.zeros( (height,width), dtype=np.complex_ )
+  # (always a new array: the one left by an earlier compute() may be
+  # kept by degrid.py, and would also hold its components)
+
+  gridImageFT = np.zeros( (height,width), dtype=np.complex_ )
 
   #get intensity threshold
-  thresh = 0.4 * maxMag
+  thresh = gridThreshold * maxMag
 
   #list of non-zero magitude coordinates
   nzMagList = []
@@ -219,7 +295,7 @@ def compute():
     angle = math.atan2(v*ratio,u)
     dist = math.sqrt(u**2+v**2)
     
-    if dist <= 6:
+    if dist <= dcRadius:
       #too close to origin to be a gridline, skip
       continue
     if angle < 0:
@@ -263,8 +339,12 @@ def compute():
   print( '6. remove grid' )
 
 
-  if resultImage is None:
-    resultImage = image.copy()
+  # the pixel values, in a type in which two can be added (loadImage()
+  # gives uint8 values)
+
+  pixels = image.astype( degrid.resultType( image.dtype ) )
+
+  resultImage = pixels.copy() # (a new array, as for gridImageFT)
 
   #define filters Fx and Fy to compute the gradient at each grid point
   Fx = [[-1,0,1],
@@ -298,11 +378,12 @@ def compute():
 
   for y in range(height):
     for x in range(width):
-      if gridImage[y][x] > 16:
+      if gridImage[y][x] > gridCutoff:
         # get gradient direction at gridline pixel
 
-        Gx = applyFilter(smoothGrid, x, y, Fx)
-        Gy = applyFilter(smoothGrid, x, y, Fy)
+        #(the grid image is complex, with zero imaginary parts)
+        Gx = np.real(applyFilter(smoothGrid, x, y, Fx))
+        Gy = np.real(applyFilter(smoothGrid, x, y, Fy))
         grad_dir = (math.atan2(Gy,Gx) / (2*math.pi)) * 360
 
 
@@ -315,11 +396,11 @@ def compute():
           a2diff -= 180
 
         if abs(a1diff - 90) < abs(a2diff - 90):
-          p1 = getPixel(x, y, gridImage, image, angle1)
-          p2 = getPixel(x, y, gridImage, image, angle1 + 180)
+          p1 = getPixel(x, y, gridImage, pixels, angle1)
+          p2 = getPixel(x, y, gridImage, pixels, angle1 + 180)
         else:
-          p1 = getPixel(x, y, gridImage, image, angle2)
-          p2 = getPixel(x, y, gridImage, image, angle2 + 180)
+          p1 = getPixel(x, y, gridImage, pixels, angle2)
+          p2 = getPixel(x, y, gridImage, pixels, angle2 + 180)
         
         #get pixels on either side
         #note: grid image has relatively little noise so smoothing was
@@ -330,8 +411,39 @@ def compute():
 
   print( 'done' )
 
+  panelCache.clear() # (the arrays may have been changed in place, so must be prepared again for display)
+
   return resultImage, lines
 
+# Print the metrics of the last compute(), and add them to 'metricsLog'
+
+def reportMetrics():
+
+  print( degrid.stepReport( computeMetrics ) )
+
+  if metricsLog is not None:
+    with open( metricsLog, 'a' ) as f:
+      f.write( json.dumps( dict( computeMetrics, file=imageFilename ) ) + '\n' )
+
+
+
+# Return the full FT from the half FT 'half' from degrid.removeGrid().
+# If 'shown' (the full FT now shown) was made from the same half FT, it
+# is returned, so that an FT that a parameter change leaves unchanged
+# is not filled in and prepared for display again.
+
+shownFTs = []                   # (half FT, full FT) of the FTs from the last compute() with degrid.py
+
+def fullFT( half, shown ):
+
+  for shownHalf, shownFull in shownFTs:
+    if shownHalf is half and shownFull is shown:
+      return shown
+
+  return spectrum.fullFT( half, image.shape[1] )
+
+
+
 def applyFilter(image, x, y, filt):
   #computes the filter value at a particular point
   height = image.shape[0]
@@ -365,7 +477,7 @@ def getPixel(x, y, grid, orig, angle):
     if xprime < 0 or xprime >= width or yprime < 0 or yprime >= height:
       #out of bounds, return 0
       return 0
-    elif grid[yprime][xprime] <= 16:
+    elif grid[yprime][xprime] <= gridCutoff:
       return orig[yprime][xprime]
   return 0
     
@@ -384,12 +496,18 @@ if haveTK:
 
 # Do a forward FT
 #
-# Input is a 2D numpy array of complex values.
-# Output is the same.
+# Input is a 2D numpy array of real (e.g. uint8, as loaded) or complex
+# values.  Output is a 2D numpy array of complex values.
+#
+# If the image is real (as loaded images are), the FT is found from
+# the half FT of spectrum.py, which is kept for the current image.
 
 def forwardFT( image ):
 
-  return np.fft.fft2( image )
+  if np.isrealobj( image ) or not np.any( np.imag( image ) ):
+    return spectrum.fullFT( spectrum.halfFT( image ), image.shape[1] )
+  else:
+    return np.fft.fft2( image )
 
 
 
@@ -424,20 +542,9 @@ def display( window ):
 
   # Set up texturing
 
-  global texID
-  
-  if texID == None:
-    texID = glGenTextures(1)
-
   glPixelStorei( GL_UNPACK_ALIGNMENT, 1 )
-  glBindTexture( GL_TEXTURE_2D, texID )
 
   glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
-  glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_BORDER)
-  glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_BORDER)
-  glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-  glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-  glTexParameterfv(GL_TEXTURE_2D, GL_TEXTURE_BORDER_COLOR, [1,0,0,1] );
 
   # Images to draw, in rows and columns
 
@@ -447,10 +554,7 @@ def display( window ):
     for c in range(cols):
       if toDraw[r][c] is not None:
 
-        if r == 0: # normal image in row 0 
-          img = toDraw[r][c]
-        else: # FT in column 1
-          img = np.fft.fftshift( toDraw[r][c] ) # shift FT so that origin is in centre (just for display)
+        img = toDraw[r][c]
 
         height = scale * img.shape[0]
         width  = scale * img.shape[1]
@@ -460,31 +564,11 @@ def display( window ):
         baseX = (horizSpacing + maxWidth ) * c + horizSpacing
         baseY = (vertSpacing  + maxHeight) * (rows-1-r) + vertSpacing
 
-        # Get pixels and draw
-
-        if r == 0: # for images (in row 0), show the real part of each pixel
-          show = np.real(img)
-        else: # for FT (in column 1), show magnitude or phase
-          ak =  2 * np.real(img)
-          bk = -2 * np.imag(img)
-          if showMagnitude:
-            show = np.log( 1 + np.sqrt( ak*ak + bk*bk ) ) # take the log because there are a few very large values (e.g. the DC component)
-          else:
-            show = np.arctan2( -1 * bk, ak )
-
-          if doHistoEq and c > 0:
-            show = histoEq( show ) # optionally, perform histogram equalization on FT image (but this takes time!)
+        # Get pixels and texture (both updated only if the panel has changed) and draw
 
-        # Put the image into a texture, then draw it
+        imgData = panelPixels( r, c, img )
 
-        max = show.max()
-        min = show.min()
-        if max == min:
-          max = min+1
-          
-        imgData = np.array( (np.ravel(show) - min) / (max - min) * 255, np.uint8 )
-
-        glTexImage2D( GL_TEXTURE_2D, 0, GL_INTENSITY, img.shape[1], img.shape[0], 0, GL_LUMINANCE, GL_UNSIGNED_BYTE, imgData )
+        bindPanelTexture( r, c, img.shape[1], img.shape[0], imgData )
 
         # Include zoom and translate
 
@@ -557,6 +641,97 @@ def display( window ):
 
   
 
+# Prepare the pixels to show in a panel.
+#
+# Row 0 shows the real part of the image.  Row 1 shows the FT, shifted
+# so that its origin is in the centre, as magnitudes or phases.  The
+# values are scaled to [0,255].
+#
+# The pixels of each panel are kept in 'panelCache' and are prepared
+# again only when the panel's array is replaced or the display mode
+# changes, so redrawing (e.g. to zoom or translate) does not recompute
+# them.
+
+panelCache = {}                 # (row,col) -> (array, mode, pixels)
+
+def panelPixels( r, c, source ):
+
+  if r == 0:
+    mode = None
+  else:
+    mode = (showMagnitude, doHistoEq and c > 0)
+
+  if (r,c) in panelCache:
+    cachedImg, cachedMode, imgData = panelCache[(r,c)]
+    if cachedImg is source and cachedMode == mode:
+      return imgData
+
+  if r == 0: # for images (in row 0), show the real part of each pixel
+    show = np.real(source)
+  else: # for FT (in column 1), show magnitude or phase
+    img = np.fft.fftshift( source ) # shift FT so that origin is in centre (just for display)
+    ak =  2 * np.real(img)
+    bk = -2 * np.imag(img)
+    if showMagnitude:
+      show = np.log( 1 + np.sqrt( ak*ak + bk*bk ) ) # take the log because there are a few very large values (e.g. the DC component)
+    else:
+      show = np.arctan2( -1 * bk, ak )
+
+    if doHistoEq and c > 0:
+      show = histoEq( show ) # optionally, perform histogram equalization on FT image
+
+  max = float( show.max() ) # (not in the type of 'show', which may be uint8)
+  min = float( show.min() )
+  if max == min:
+    max = min+1
+
+  imgData = np.array( (np.ravel(show) - min) / (max - min) * 255, np.uint8 )
+
+  panelCache[(r,c)] = (source, mode, imgData)
+
+  return imgData
+
+
+
+# Bind the texture of a panel, after uploading the panel's pixels if
+# they have changed.
+#
+# Each panel has its own texture, which persists between frames.  The
+# pixels are uploaded only when panelPixels() has prepared new ones
+# (because the panel's array was replaced or the display mode
+# changed), and with glTexSubImage2D() if the size is unchanged.  So
+# zooming and translating just draw the textures.
+
+def bindPanelTexture( r, c, width, height, imgData ):
+
+  if (r,c) not in panelTextures:
+
+    texID = glGenTextures(1)
+    glBindTexture( GL_TEXTURE_2D, texID )
+
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_BORDER)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_BORDER)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    glTexParameterfv(GL_TEXTURE_2D, GL_TEXTURE_BORDER_COLOR, [1,0,0,1] );
+
+    panelTextures[(r,c)] = (texID, None, None)
+
+  texID, size, uploaded = panelTextures[(r,c)]
+
+  glBindTexture( GL_TEXTURE_2D, texID )
+
+  if uploaded is not imgData:
+
+    if size == (width,height):
+      glTexSubImage2D( GL_TEXTURE_2D, 0, 0, 0, width, height, GL_LUMINANCE, GL_UNSIGNED_BYTE, imgData )
+    else:
+      glTexImage2D( GL_TEXTURE_2D, 0, GL_INTENSITY, width, height, 0, GL_LUMINANCE, GL_UNSIGNED_BYTE, imgData )
+
+    panelTextures[(r,c)] = (texID, (width,height), imgData)
+
+
+
 # Get information about how to place the images.
 #
 # toDraw                       2D array of complex images 
@@ -612,56 +787,39 @@ def getImagesInfo():
 
   
 # Equalize the image histogram
+#
+# The histogram and the lookup table T[r] = s are built, and T is
+# applied, with whole-array operations.
 
 def histoEq( pixels ):
 
-  # build histogram
-
-  h = [0] * 256 # counts
-
-  width  = pixels.shape[0]
-  height = pixels.shape[1]
-
   min = pixels.min()
   max = pixels.max()
   if max == min:
     max = min+1
 
-  for i in range(width):
-    for j in range(height):
-      y = int( (pixels[i,j] - min) / (max-min) * 255 )
-      h[y] = h[y] + 1
+  bins = ((pixels - min) / (max-min) * 255).astype( int )
 
-  # Build T[r] = s
+  # build histogram
 
-  k = 256.0 / float(width * height) # common factor applied to all entries
+  h = np.bincount( bins.ravel(), minlength=256 ) # counts
 
-  T = [0] * 256 # lookup table
-  
-  sum = 0
-  for i in range(256):
-    sum = sum + h[i]
-    T[i] = int( math.floor(k * sum) - 1 )
-    if T[i] < 0:
-      T[i] = 0
+  # Build T[r] = s
 
-  # Apply T[r]
+  k = 256.0 / float(pixels.size) # common factor applied to all entries
 
-  result = np.empty( pixels.shape )
+  T = np.maximum( np.floor( k * np.cumsum( h ) ) - 1, 0 ) # lookup table
 
-  for i in range(width):
-    for j in range(height):
-      y = int( (pixels[i,j] - min) / (max - min) * 255 )
-      result[i,j] = T[y]
+  # Apply T[r]
 
-  return result
+  return T[bins]
   
 
 # Handle keyboard input
 
 def keyCallback( window, key, scancode, action, mods ):
 
-  global image, imageFT, gridImage, gridImageFT, resultImage, showMagnitude, doHistoEq, imageFilename, zoom, translate
+  global image, imageFT, gridImage, gridImageFT, resultImage, showMagnitude, doHistoEq, imageFilename, zoom, translate, computeEngine, tileSize, gridThreshold
 
   if action == glfw.PRESS:
     
@@ -690,12 +848,25 @@ def keyCallback( window, key, scancode, action, mods ):
       zoom = 1
       translate = (0,0)
 
+    elif key == glfw.KEY_E: # next compute engine
+      computeEngine = computeEngines[ (computeEngines.index( computeEngine ) + 1) % len(computeEngines) ]
+      print( 'compute engine:', computeEngine )
+
+    elif key == glfw.KEY_T: # toggle tiled grid removal
+      tileSize = 512 if tileSize is None else None
+      print( 'tiles:', tileSize )
+
     elif key == glfw.KEY_C: # compute
+      compute_all()
+
+    elif key == glfw.KEY_LEFT_BRACKET or key == glfw.KEY_RIGHT_BRACKET: # lower or raise the threshold
+
+      step = 0.05 if key == glfw.KEY_RIGHT_BRACKET else -0.05
+      gridThreshold = min( max( round( gridThreshold + step, 2 ), 0.05 ), 0.95 )
+      print( 'threshold:', gridThreshold )
 
-      resultImage, lines = compute()
-      print( 'Grid lines:' )
-      for line in lines:
-        print( '  angle %.1f, distance %d' % (line[0],line[1]) )
+      if resultImage is not None and computeEngine != 'loop': # (quick, as only the stages after the threshold are done again)
+        compute_all()
 
     elif key == glfw.KEY_DOWN:  # forward FT
       forwardFT_all()
@@ -707,6 +878,9 @@ def keyCallback( window, key, scancode, action, mods ):
 
       print( '''keys:
              c  compute the solution
+           [ ]  lower or raise the FT magnitude threshold (and compute again)
+             e  cycle through the array, peaks and loop compute engines
+             t  toggle grid removal in tiles
              m  toggle between magnitude and phase in the FT  
              h  toggle histogram equalization in the FT  
              l  load image
@@ -718,6 +892,20 @@ def keyCallback( window, key, scancode, action, mods ):
 
 
 
+# Compute the solution and print the grid lines
+
+
+def compute_all():
+
+  global resultImage
+
+  resultImage, lines = compute()
+  print( 'Grid lines:' )
+  for line in lines:
+    print( '  angle %.1f, distance %d' % (line[0],line[1]) )
+
+
+
 # Do a forward FT to image
 
 
@@ -742,25 +930,6 @@ def inverseFT_all():
 
 
     
-# Load an image
-#
-# Return the image as a 2D numpy array of complex_ values.
-
-
-def loadImage( path ):
-
-  try:
-    img = Image.open( path ).convert( 'L' ).transpose( Image.FLIP_TOP_BOTTOM )
-  except:
-    print( 'Failed to load image %s' % path )
-    sys.exit(1)
-
-  img = ImageOps.invert(img)
-
-  return np.array( list( img.getdata() ), np.complex_ ).reshape( (img.size[1],img.size[0]) )
-
-
-
 # Handle window reshape
 
 def reshape( newWidth, newHeight ):
@@ -774,37 +943,6 @@ def reshape( newWidth, newHeight ):
 
 
 
-# Output an image
-#
-# The image has complex values, so output either the magnitudes or the
-# phases, according to the 'outputMagnitudes' parameter.
-
-def outputImage( image, filename, outputMagnitudes, isFT, invert ):
-
-  if not isFT:
-    show = np.real(image)
-  else:
-    ak =  2 * np.real(image)
-    bk = -2 * np.imag(image)
-    if outputMagnitudes:
-      show = np.log( 1 + np.sqrt( ak*ak + bk*bk ) ) # take the log because there are a few very large values (e.g. the DC component)
-    else:
-      show = np.arctan2( -1 * bk, ak )
-    show = np.fft.fftshift( show ) # shift FT so that origin is in centre
-
-  min = show.min()
-  max = show.max()
-
-  img = Image.fromarray( np.uint8( (show - min) * (255 / (max-min)) ) ).transpose( Image.FLIP_TOP_BOTTOM )
-
-  if invert:
-    img = ImageOps.invert(img) 
-
-  img.save( filename )
-
-
-
-
 # Draw text in window
 
 def drawText( x, y, text ):
@@ -986,6 +1124,8 @@ def wrap( val, max ):
 
 def main_interactive():
 
+    importGUI()
+
     if not glfw.init():
         print( 'Error: GLFW failed to initialize' )
         sys.exit(1)
@@ -1040,54 +1180,59 @@ def main_interactive():
 # The command line (stored in sys.argv) could have:
 #
 #     main.py {image filename}
+#
+# This is done only when main.py is run, and not when it is imported,
+# so importing it does not load an image or open a window.
 
-if len(sys.argv) > 1:
-  imageFilename = sys.argv[1]
-  imagePath = os.path.join( imageDir,  imageFilename  )
-
-image  = loadImage( imagePath )
-
+if __name__ == '__main__':
 
-# If commands exist on the command line (i.e. there are more than two
-# arguments), process each command, then exit.  Otherwise, go into
-# interactive mode.
-#
-# DO NOT MODIFY THIS CODE, AS IT IS USED FOR TESTING THE ASSIGNMENT.
-#
-# You can use this for your own testing, if you wish.
+  if len(sys.argv) > 1:
+    imageFilename = sys.argv[1]
+    imagePath = os.path.join( imageDir,  imageFilename  )
 
-if len(sys.argv) <= 2:
+  image  = loadImage( imagePath )
 
-  main_interactive()
 
-else:
+  # If commands exist on the command line (i.e. there are more than two
+  # arguments), process each command, then exit.  Otherwise, go into
+  # interactive mode.
+  #
+  # DO NOT MODIFY THIS CODE, AS IT IS USED FOR TESTING THE ASSIGNMENT.
+  #
+  # You can use this for your own testing, if you wish.
 
-  # process commands
-      
-  outputMagnitudes = True
+  if len(sys.argv) <= 2:
 
-  # process commands
+    main_interactive()
 
-  cmds = sys.argv[2:]
+  else:
 
-  while len(cmds) > 0:
-    cmd = cmds.pop(0)
-    if cmd == 'f':
-      forwardFT_all()
-    elif cmd == 'i':
-      inverseFT_all()
-    elif cmd == 'm':
-      outputMagnitudes = True
-    elif cmd == 'p':
-      outputMagnitudes = False
-    elif cmd == 'c':
-      image, lines = compute()
-      print( lines )
-    elif cmd[0] == 'o': # image name follows in 'cmds'
-      filename = cmds.pop(0)
-      outputImage( resultImage, filename, False, False, True )
-    else:
-      print( """command '%s' not understood.
+    # process commands
+
+    outputMagnitudes = True
+
+    # process commands
+
+    cmds = sys.argv[2:]
+
+    while len(cmds) > 0:
+      cmd = cmds.pop(0)
+      if cmd == 'f':
+        forwardFT_all()
+      elif cmd == 'i':
+        inverseFT_all()
+      elif cmd == 'm':
+        outputMagnitudes = True
+      elif cmd == 'p':
+        outputMagnitudes = False
+      elif cmd == 'c':
+        image, lines = compute()
+        print( lines )
+      elif cmd[0] == 'o': # image name follows in 'cmds'
+        filename = cmds.pop(0)
+        outputImage( resultImage, filename, False, False, True )
+      else:
+        print( """command '%s' not understood.
 command-line arguments:
   c - compute  
   f - apply forward FT
@@ -0,0 +1,81 @@
+# Loading and output of images
+#
+# These are used by main.py and, since they do not need OpenGL, by the
+# headless batch.py and stream.py.
+
+
+import sys
+
+import numpy as np
+from PIL import Image, ImageOps, ImageSequence
+
+
+# Load an image
+#
+# Return the image as a 2D numpy array of uint8 values, read directly
+# from the decoded image.  It is not converted to complex values: the
+# FT functions take real images, and the result of compute() is real.
+
+
+def loadImage( path ):
+
+  try:
+    img = Image.open( path ).convert( 'L' ).transpose( Image.FLIP_TOP_BOTTOM )
+  except:
+    print( 'Failed to load image %s' % path )
+    sys.exit(1)
+
+  img = ImageOps.invert(img)
+
+  return np.array( img, np.uint8 ) # (height x width, from the image's buffer)
+
+
+
+# Load the pages of an image file that may have several (e.g. a
+# multi-frame TIFF), one at a time, as a generator.  Yields (page
+# number, number of pages, page) for each, with the page as
+# loadImage() returns it.  Only one page is decoded at a time.
+#
+# Raises an exception (from Pillow) if the file cannot be read.
+
+def loadPages( path ):
+
+  with Image.open( path ) as img:
+
+    numPages = getattr( img, 'n_frames', 1 )
+
+    for pageNumber, frame in enumerate( ImageSequence.Iterator( img ) ):
+
+      frame = ImageOps.invert( frame.convert( 'L' ).transpose( Image.FLIP_TOP_BOTTOM ) )
+
+      yield pageNumber, numPages, np.array( frame, np.uint8 )
+
+
+
+# Output an image
+#
+# The image has complex values, so output either the magnitudes or the
+# phases, according to the 'outputMagnitudes' parameter.
+
+def outputImage( image, filename, outputMagnitudes, isFT, invert ):
+
+  if not isFT:
+    show = np.real(image)
+  else:
+    ak =  2 * np.real(image)
+    bk = -2 * np.imag(image)
+    if outputMagnitudes:
+      show = np.log( 1 + np.sqrt( ak*ak + bk*bk ) ) # take the log because there are a few very large values (e.g. the DC component)
+    else:
+      show = np.arctan2( -1 * bk, ak )
+    show = np.fft.fftshift( show ) # shift FT so that origin is in centre
+
+  min = show.min()
+  max = show.max()
+
+  img = Image.fromarray( np.uint8( (show - min) * (255 / (max-min)) ) ).transpose( Image.FLIP_TOP_BOTTOM )
+
+  if invert:
+    img = ImageOps.invert(img) 
+
+  img.save( filename )
@@ -0,0 +1,168 @@
+# Peaks in the FT of a grid
+#
+# A regular grid of lines has an FT with bright peaks on a lattice,
+# along two directions (perpendicular to the two sets of lines).
+# findPeaks() finds the local maxima of the FT magnitude that are
+# above a threshold, and findLines() groups them by direction to find
+# the angle and spacing of the grid lines.
+#
+# Only the components above the threshold are examined, so the work
+# after the thresholding (which is one array operation) is
+# proportional to the number of such components, not to the image
+# size.
+#
+# As in compute(), positions in the FT are (u,v), with u and v wrapped
+# into [-width/2,width/2) and [-height/2,height/2).  The angle of a
+# peak is that of the vector (u,v*width/height), in degrees in [0,180),
+# and its radius is the length of (u,v).
+
+
+import math
+
+import numpy as np
+
+
+peakType = np.dtype( [ ('u',int), ('v',int), ('magnitude',float), ('angle',float), ('radius',float) ] )
+
+clusterSeparation = 45 # min angle (in degrees) between the two grid directions
+clusterTolerance  = 10 # max angle (in degrees) from a direction to a peak on it
+
+
+# Find the peaks in the FT with magnitudes 'mags', given as its left
+# half (columns 0 to width//2, as from np.fft.rfft2()).  A peak is a
+# component with magnitude at least 'threshold' and at least that of
+# its eight neighbours.  The DC component is excluded, as are peaks
+# within 'minRadius' of the origin.
+#
+# Returns an array of 'peakType' records, sorted by decreasing
+# magnitude.  Both (u,v) and (-u,-v) are included.
+
+def findPeaks( mags, width, threshold, minRadius=0 ):
+
+  height = mags.shape[0]
+
+  # components above the threshold, in the half and (by symmetry) in
+  # the other half
+
+  ys, xs = np.nonzero( mags >= threshold )
+
+  mirrored = (xs > 0) & (2*xs < width) # (columns 0 and width/2 are their own mirrors)
+
+  xs = np.concatenate( (xs, width - xs[mirrored]) )
+  ys = np.concatenate( (ys, (height - ys[mirrored]) % height) )
+
+  keep = (xs != 0) | (ys != 0)
+  xs = xs[keep]
+  ys = ys[keep]
+
+  # keep the local maxima
+
+  peakMags = magnitudeAt( mags, xs, ys, width )
+
+  isPeak = isLocalMax( mags, xs, ys, width, peakMags )
+
+  xs = xs[isPeak]
+  ys = ys[isPeak]
+  peakMags = peakMags[isPeak]
+
+  # build the table
+
+  u = np.where( xs >= width/2,  xs-width,  xs )
+  v = np.where( ys >= height/2, ys-height, ys )
+
+  peaks = np.zeros( len(u), peakType )
+
+  peaks['u'] = u
+  peaks['v'] = v
+  peaks['magnitude'] = peakMags
+  peaks['angle']  = np.degrees( np.arctan2( v * (width/height), u ) ) % 180
+  peaks['radius'] = np.sqrt( u*u + v*v )
+
+  peaks = peaks[ peaks['radius'] > minRadius ]
+
+  return peaks[ np.argsort( -peaks['magnitude'], kind='stable' ) ]
+
+
+# Return the magnitudes at full-FT positions (xs,ys) from the half
+# magnitudes 'mags'
+
+def magnitudeAt( mags, xs, ys, width ):
+
+  height = mags.shape[0]
+
+  inRight = (xs >= mags.shape[1])
+
+  xs = np.where( inRight, width - xs, xs )
+  ys = np.where( inRight, (height - ys) % height, ys )
+
+  return mags[ys,xs]
+
+
+# Return whether the magnitudes at full-FT positions (xs,ys), which are
+# 'peakMags', are at least those of their eight neighbours
+
+def isLocalMax( mags, xs, ys, width, peakMags ):
+
+  height = mags.shape[0]
+
+  isPeak = np.ones( len(xs), bool )
+
+  for dy in [-1,0,1]:
+    for dx in [-1,0,1]:
+      if dx != 0 or dy != 0:
+        isPeak &= (peakMags >= magnitudeAt( mags, (xs+dx) % width, (ys+dy) % height, width ))
+
+  return isPeak
+
+
+# Find the two grid directions from 'peaks' (as from findPeaks()).
+#
+# The strongest peak gives the first direction.  The strongest peak at
+# least 'clusterSeparation' degrees from that gives the second.  Each
+# direction's angle is then the magnitude-weighted mean angle of the
+# peaks within 'clusterTolerance' degrees of it, and its distance is
+# the smallest radius among those peaks.  Peaks in other directions
+# (e.g. the diagonals of the lattice) are ignored.
+#
+# Returns [ (angle1,distance1), (angle2,distance2) ] as compute() does,
+# or None if there are not peaks in two directions.
+
+def findLines( peaks ):
+
+  if len(peaks) == 0:
+    return None
+
+  first = peaks['angle'][0]
+
+  others = np.flatnonzero( angleDifference( peaks['angle'], first ) >= clusterSeparation )
+
+  if len(others) == 0:
+    return None
+
+  second = peaks['angle'][others[0]]
+
+  lines = []
+
+  for direction in [first, second]:
+
+    diffs = signedDifference( peaks['angle'], direction )
+    near  = (np.absolute( diffs ) <= clusterTolerance)
+
+    weights = peaks['magnitude'][near]
+    angle   = (direction + np.sum( weights * diffs[near] ) / np.sum( weights )) % 180
+
+    lines.append( (angle, peaks['radius'][near].min()) )
+
+  return lines
+
+
+# Difference of angles a-b, in degrees, as directions (so in [-90,90))
+
+def signedDifference( a, b ):
+
+  return (a - b + 90) % 180 - 90
+
+
+def angleDifference( a, b ):
+
+  return np.absolute( signedDifference( a, b ) )
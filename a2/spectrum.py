@@ -0,0 +1,92 @@
+# FTs of real images
+#
+# The images are real, so their FTs are Hermitian: the component at
+# (-x,-y) is the complex conjugate of that at (x,y).  Only the left
+# half, columns 0 to width//2, need be computed and stored.  That is
+# what np.fft.rfft2() does, at about half the time and memory of
+# np.fft.fft2().  fullFT() fills in the right half when the whole FT
+# is needed (e.g. to display it).
+#
+# The half FT of the current image is kept, so that finding it again
+# for the same image (e.g. in compute() after forwardFT_all()) costs
+# nothing.
+#
+# An FFT is fastest when the size factors into small primes.
+# fastSize() finds the next 5-smooth size (with factors of only 2, 3
+# and 5), to which an image can be padded when the FT is used for
+# something that does not depend on the size, like a convolution.
+
+
+import numpy as np
+
+
+cachedImage  = None   # image whose half FT is in 'cachedHalfFT'
+cachedHalfFT = None
+
+
+# Return the half FT of the real image 'image' (or of the real part, if
+# it is complex).  If 'shape' is given, the image is zero-padded to that
+# shape, and the FT is not kept.
+
+def halfFT( image, shape=None ):
+
+  global cachedImage, cachedHalfFT
+
+  if shape is not None:
+    return np.fft.rfft2( np.real( image ), shape )
+
+  if image is not cachedImage:
+    cachedHalfFT = np.fft.rfft2( np.real( image ) )
+    cachedImage  = image
+
+  return cachedHalfFT
+
+
+# Return the real image of the given width from its half FT
+
+def inverseHalfFT( half, width ):
+
+  return np.fft.irfft2( half, (half.shape[0],width) )
+
+
+# Return the full FT, of the given width, from the half FT.  This also
+# works for a boolean array that marks components of the half FT.
+
+def fullFT( half, width ):
+
+  height = half.shape[0]
+
+  full = np.empty( (height,width), half.dtype )
+
+  full[:,:half.shape[1]] = half
+
+  # right half from the conjugates at (-x,-y)
+
+  rows = (-np.arange( height )) % height
+  cols = width - np.arange( half.shape[1], width )
+
+  right = half[rows][:,cols]
+
+  full[:,half.shape[1]:] = np.conj( right ) if np.iscomplexobj( half ) else right
+
+  return full
+
+
+# Return the smallest 5-smooth number that is at least n
+
+def fastSize( n ):
+
+  best = 2 * n
+
+  power2 = 1
+  while power2 < best:
+    power3 = power2
+    while power3 < best:
+      power5 = power3
+      while power5 < n:
+        power5 *= 5
+      best = min( best, power5 )
+      power3 *= 3
+    power2 *= 2
+
+  return best
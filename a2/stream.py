@@ -0,0 +1,190 @@
+# Streaming grid removal of many pages
+#
+# Removes the grid from a stream of ECG pages, one page at a time,
+# without opening a window.  The command line is
+#
+#     stream.py {input} {output directory} [{prefetch} [{engine} [templates]]]
+#
+# where {input} is an image file with one or more pages (e.g. a
+# multi-frame TIFF), a directory of such files, or a glob (quoted, so
+# that the shell does not expand it).  {prefetch} is the number of
+# pages that are decoded ahead, and of results that may be waiting to
+# be written (default 2).  {engine} is 'array' (the default) or
+# 'peaks', as for batch.py.  With 'templates', grid templates (see
+# templates.py) are used, so pages with the same grid as an earlier
+# page are done more quickly.
+#
+# Unlike batch.py, which gives whole files to a pool of processes,
+# this reads the pages through a generator, so a multi-page file is
+# never decoded all at once.  A background thread decodes the next
+# pages while the current one is computed, and another thread writes
+# the results with pages.outputImage().  Both stay at most {prefetch}
+# pages ahead of the computation, so the memory used is the same for
+# ten pages as for tens of thousands.
+#
+# Each result is written to the output directory under its input
+# file's name or, for a file with several pages, as {name}-{page
+# number}{extension}.  As in batch.py, if files in different
+# directories have the same name, their paths relative to the
+# directory that holds all of them are used instead.  The lines found
+# for each page are added to lines.csv in the output directory as soon
+# as the page is done, and its metrics to metrics.jsonl, as for
+# batch.py.
+
+
+import sys, os, time, csv, io, contextlib, threading, queue, collections, concurrent.futures
+
+import numpy as np
+
+import pages, degrid, templates, batch
+
+
+# Generate (output name, page) for each page of the files in 'spec'.
+# If a file cannot be read, (output name, exception) is generated for
+# it instead.
+
+def readPages( spec ):
+
+  paths = [ spec ] if os.path.isfile( spec ) else batch.findPages( spec )
+  names = batch.outputNames( paths )
+
+  for path in paths:
+
+    name, extension = os.path.splitext( names[path] )
+
+    try:
+      for pageNumber, numPages, page in pages.loadPages( path ):
+        if numPages > 1:
+          yield '%s-%04d%s' % (name, pageNumber+1, extension), page
+        else:
+          yield name + extension, page
+    except Exception as e: # (e.g. not an image, or a damaged page)
+      yield name + extension, e
+
+
+# Generate the items of 'generator', which is run on a background
+# thread that stays at most 'depth' items ahead.  An exception in the
+# generator is raised here.
+
+endOfItems = object()
+
+def prefetch( generator, depth ):
+
+  items = queue.Queue( depth )
+
+  def run():
+    try:
+      for item in generator:
+        items.put( item )
+      items.put( endOfItems )
+    except Exception as e:
+      items.put( e )
+
+  threading.Thread( target=run, daemon=True ).start()
+
+  while True:
+
+    item = items.get()
+
+    if item is endOfItems:
+      return
+    if isinstance( item, Exception ):
+      raise item
+
+    yield item
+
+
+# Wait for the result called 'name' to be written by 'future'
+
+def finishWrite( name, future ):
+
+  try:
+    future.result()
+  except Exception as e:
+    sys.stderr.write( 'Failed to write %s: %s\n' % (name, e) )
+
+
+# Remove the grid from each page in 'spec', with at most 'depth' pages
+# decoded ahead and 'depth' results waiting to be written
+
+def processStream( spec, outputDir, depth, engine, useTemplates=False ):
+
+  os.makedirs( outputDir, exist_ok=True )
+
+  latencies = []
+
+  startTime = time.perf_counter()
+
+  with open( os.path.join( outputDir, 'lines.csv' ), 'w', newline='' ) as f, \
+       open( os.path.join( outputDir, 'metrics.jsonl' ), 'w' ) as metricsFile, \
+       concurrent.futures.ThreadPoolExecutor( 1 ) as writer:
+
+    table = csv.writer( f )
+    table.writerow( batch.linesHeader )
+
+    writing = collections.deque() # (name, future) of the results being written, oldest first
+
+    for name, page in prefetch( readPages( spec ), depth ):
+
+      if isinstance( page, Exception ):
+        sys.stderr.write( 'Failed to read %s: %s\n' % (name, page) )
+        continue
+
+      pageStart = time.perf_counter()
+
+      try:
+        with contextlib.redirect_stdout( io.StringIO() ): # (removeGrid() prints its steps)
+          imageHalfFT, gridHalfFT, gridImage, resultImage, lines, metrics = degrid.removeGrid( page, engine == 'peaks', useTemplates=useTemplates )
+      except (ValueError, IndexError, ZeroDivisionError) as e: # (no peaks in two directions)
+        sys.stderr.write( 'Failed to process %s: %s\n' % (name, e) )
+        continue
+
+      seconds = time.perf_counter() - pageStart
+
+      # write the result in the background, with at most 'depth' waiting
+
+      os.makedirs( os.path.dirname( os.path.join( outputDir, name ) ), exist_ok=True )
+
+      writing.append( (name, writer.submit( pages.outputImage, resultImage, os.path.join( outputDir, name ), False, False, True )) )
+
+      while len(writing) > depth:
+        finishWrite( *writing.popleft() )
+
+      latencies.append( seconds )
+      table.writerow( batch.linesRow( name, lines, seconds ) )
+      metricsFile.write( batch.metricsLine( name, metrics ) )
+      sys.stderr.write( batch.pageReport( name, seconds, metrics ) )
+
+    while writing:
+      finishWrite( *writing.popleft() )
+
+  elapsed = time.perf_counter() - startTime
+
+  if latencies:
+    sys.stderr.write( '%d pages in %.2f seconds\n' % (len(latencies), elapsed) )
+    sys.stderr.write( 'latency: median %.1f ms, max %.1f ms\n' % (np.median(latencies)*1000, max(latencies)*1000) )
+    sys.stderr.write( 'throughput: %.2f pages/s\n' % (len(latencies)/elapsed) )
+    if useTemplates:
+      sys.stderr.write( 'templates: %d pages matched, %d did not (%d templates rejected)\n' % (templates.templateHits, templates.templateMisses, templates.templateRejects) )
+  else:
+    sys.stderr.write( "No pages processed from '%s'.\n" % spec )
+
+
+
+usage = 'Usage: stream.py {input} {output directory} [{prefetch} [{engine} [templates]]]\n'
+
+if __name__ == '__main__':
+
+  if len(sys.argv) < 3:
+    sys.stderr.write( usage )
+    sys.exit(1)
+
+  depth = int( sys.argv[3] ) if len(sys.argv) > 3 else 2
+  engine = sys.argv[4] if len(sys.argv) > 4 else 'array'
+  useTemplates = (len(sys.argv) > 5)
+
+  if depth < 1 or engine not in [ 'array', 'peaks' ] or (useTemplates and sys.argv[5] != 'templates'):
+    sys.stderr.write( usage )
+    sys.exit(1)
+
+  processStream( sys.argv[1], sys.argv[2], depth, engine, useTemplates )
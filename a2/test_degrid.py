@@ -0,0 +1,90 @@
+# Tests of the stage results kept by degrid.removeGrid()
+#
+# Run with 'python -m pytest' in this directory.
+
+
+import os, io, contextlib
+
+import numpy as np
+
+import degrid, pages
+
+
+imageDir = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'images' )
+
+
+# Run degrid.removeGrid() quietly.  Returns everything but the metrics.
+
+def removeGrid( image, *args, **kwargs ):
+
+  with contextlib.redirect_stdout( io.StringIO() ): # (removeGrid() prints its steps)
+    return degrid.removeGrid( image, *args, **kwargs )[:5]
+
+
+# Check that two results of removeGrid() are the same
+
+def assertSame( results, expected ):
+
+  for result, value in zip( results[:4], expected[:4] ):
+    assert np.array_equal( result, value )
+
+  assert results[4] == expected[4]
+
+
+# After the threshold, cutoff and radius are changed, and changed back,
+# the results computed from the kept stages are the same as those of a
+# fresh run on a copy of the image (for which no stage is kept).  The
+# fresh runs are done after, as they replace the kept stages.
+
+def test_incrementalMatchesFresh():
+
+  image = pages.loadImage( os.path.join( imageDir, 'small.png' ) )
+
+  settings = [ (0.4, 16, 6), (0.5, 16, 6), (0.5, 20, 6), (0.5, 20, 4), (0.35, 20, 4), (0.4, 16, 6) ]
+
+  for usePeaks in [ False, True ]:
+
+    degrid.stageResults.clear()
+
+    incremental = [ removeGrid( image, usePeaks, *setting ) for setting in settings ]
+
+    for setting, results in zip( settings, incremental ):
+      assertSame( results, removeGrid( image.copy(), usePeaks, *setting ) )
+
+
+# A threshold that keeps different components updates the smoothed
+# grid from the changed ones, with the same results as a fresh run
+
+def test_updatedGridMatchesFresh():
+
+  image = pages.loadImage( os.path.join( imageDir, 'small.png' ) )
+
+  degrid.stageResults.clear()
+
+  with contextlib.redirect_stdout( io.StringIO() ):
+    degrid.removeGrid( image )
+    updated = degrid.removeGrid( image, threshold=0.3 )
+
+  assert updated[5]['changedComponents'] > 0
+
+  assertSame( updated[:5], removeGrid( image.copy(), threshold=0.3 ) )
+
+
+# Only the stages after a changed parameter are done again
+
+def test_onlyLaterStagesRerun():
+
+  image = pages.loadImage( os.path.join( imageDir, 'small.png' ) )
+
+  degrid.stageResults.clear()
+
+  with contextlib.redirect_stdout( io.StringIO() ):
+    degrid.removeGrid( image )
+    cutoffMetrics    = degrid.removeGrid( image, cutoff=20 )[5]
+    thresholdMetrics = degrid.removeGrid( image, threshold=0.5 )[5]
+
+  rerun = [ stageMetrics['name'] for stageMetrics in cutoffMetrics['stages'] if not stageMetrics['reused'] ]
+  assert rerun == [ '6. remove grid' ]
+
+  rerun = [ stageMetrics['name'][0] for stageMetrics in thresholdMetrics['stages'] if not stageMetrics['reused'] ]
+  assert rerun == [ '3', '4', '5', '6', '6', '6' ]
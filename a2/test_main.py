@@ -0,0 +1,109 @@
+# Tests of the compute engines and histoEq() in main.py
+#
+# Run with 'python -m pytest' in this directory.  The loop
+# implementation takes a few seconds on images/small.png.
+
+
+import os, io, math, contextlib
+
+import numpy as np
+import pytest
+
+import main
+
+
+imageDir = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'images' )
+
+
+# Run compute() on 'image' with 'engine', as compute_all() does (so
+# the arrays of the last compute() are left in main.py).  Returns the
+# result image and the lines.
+
+def runEngine( image, engine ):
+
+  main.image = image
+  main.computeEngine = engine
+  main.tileSize = None
+
+  with contextlib.redirect_stdout( io.StringIO() ): # (compute() prints its steps)
+    main.resultImage, lines = main.compute()
+
+  return main.resultImage, lines
+
+
+# The array engine gives the same lines and result as the loop
+# implementation
+
+def test_arrayEngineMatchesLoop():
+
+  image = main.loadImage( os.path.join( imageDir, 'small.png' ) )
+
+  arrayResult, arrayLines = runEngine( image, 'array' )
+  arrayCopy = arrayResult.copy()
+
+  loopResult, loopLines = runEngine( image, 'loop' )
+
+  assert len(arrayLines) == 2
+  assert np.array( arrayLines ) == pytest.approx( np.array( loopLines ), abs=1e-9 )
+  assert np.array_equal( np.real( arrayResult ), np.real( loopResult ) )
+
+  # the loop implementation does not write into the arrays that
+  # degrid.py keeps, so the array engine gives the same result again
+
+  assert loopResult is not arrayResult
+  assert np.array_equal( runEngine( image, 'array' )[0], arrayCopy )
+
+
+# histoEq() as it was written with loops, for comparison
+
+def loopHistoEq( pixels ):
+
+  h = [0] * 256
+
+  width  = pixels.shape[0]
+  height = pixels.shape[1]
+
+  min = pixels.min()
+  max = pixels.max()
+  if max == min:
+    max = min+1
+
+  for i in range(width):
+    for j in range(height):
+      y = int( (pixels[i,j] - min) / (max-min) * 255 )
+      h[y] = h[y] + 1
+
+  k = 256.0 / float(width * height)
+
+  T = [0] * 256
+
+  sum = 0
+  for i in range(256):
+    sum = sum + h[i]
+    T[i] = int( math.floor(k * sum) - 1 )
+    if T[i] < 0:
+      T[i] = 0
+
+  result = np.empty( pixels.shape )
+
+  for i in range(width):
+    for j in range(height):
+      y = int( (pixels[i,j] - min) / (max - min) * 255 )
+      result[i,j] = T[y]
+
+  return result
+
+
+# The vectorized histoEq() gives the same result as the loops, for
+# real and uint8 images and for a constant image
+
+def test_histoEqMatchesLoops():
+
+  rng = np.random.default_rng( 457 )
+
+  images = [ rng.normal( 100, 40, (37,53) ),
+             rng.integers( 0, 256, (64,48) ).astype( np.uint8 ),
+             np.full( (5,7), 3.0 ) ]
+
+  for pixels in images:
+    assert np.array_equal( main.histoEq( pixels ), loopHistoEq( pixels ) )
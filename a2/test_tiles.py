@@ -0,0 +1,87 @@
+# Tests of the tile layout and line combination in tiles.py
+#
+# Run with 'python -m pytest' in this directory.
+
+
+import numpy as np
+import pytest
+
+import tiles
+
+
+# The tiles start at 0, step by tileSize-overlap, cover the whole
+# length and end with a tile that ends at the length
+
+def test_tileStarts():
+
+  assert tiles.tileStarts( 100, 128, 32 ) == [0]
+  assert tiles.tileStarts( 128, 128, 32 ) == [0]
+  assert tiles.tileStarts( 129, 128, 32 ) == [0, 1]
+  assert tiles.tileStarts( 320, 128, 32 ) == [0, 96, 192]
+  assert tiles.tileStarts( 300, 100, 0 )  == [0, 100, 200]
+
+  for length in range( 1, 600, 7 ):
+    for tileSize, overlap in [ (64,0), (64,16), (64,31), (100,49) ]:
+
+      starts = tiles.tileStarts( length, tileSize, overlap )
+
+      covered = np.zeros( length, bool )
+      for start in starts:
+        covered[start:start+tileSize] = True
+
+      assert starts[0] == 0
+      assert covered.all()
+      assert all( 0 < b-a <= tileSize-overlap for a, b in zip( starts, starts[1:] ) )
+
+
+# The weights are 1 inside the tile, fall across the overlap only at
+# the ends that fade, and the ramps of two neighbours sum to 1
+
+def test_tileWeights():
+
+  assert np.array_equal( tiles.tileWeights( 50, 0, True, True ), np.ones( 50 ) )
+  assert np.array_equal( tiles.tileWeights( 50, 8, False, False ), np.ones( 50 ) )
+
+  weights = tiles.tileWeights( 50, 8, True, False )
+  assert np.all( (weights[:8] > 0) & (weights[:8] < 1) )
+  assert np.all( weights[8:] == 1 )
+  assert np.all( np.diff( weights[:8] ) > 0 )
+
+  start = tiles.tileWeights( 50, 8, True, False )
+  end   = tiles.tileWeights( 50, 8, False, True )
+  assert np.allclose( start[:8] + end[-8:], 1 )
+
+  short = tiles.tileWeights( 5, 8, True, True ) # (shorter than the overlap)
+  assert short.shape == (5,)
+  assert np.all( short > 0 )
+
+
+# The overlap must be at least 0 and less than half the tile size
+
+def test_badOverlap():
+
+  image = np.zeros( (64,64) )
+
+  for overlap in [ -1, 32, 64, 100 ]:
+    with pytest.raises( ValueError ):
+      tiles.removeGridTiled( image, 64, overlap, 1 )
+
+
+# Two lines are found even if a tile's lines are in the other order,
+# and no tile with lines is an error
+
+def test_medianLines():
+
+  tileLines = [ ((0,0),   [ (10.0, 20.0), (100.0, 30.0) ]),
+                ((64,0),  [ (101.0, 31.0), (11.0, 21.0) ]),
+                ((0,64),  None),
+                ((64,64), [ (9.0, 19.0), (99.0, 29.0) ]) ]
+
+  lines = tiles.medianLines( tileLines, 64, 64, 64, 64 )
+
+  assert len(lines) == 2
+  assert lines[0] == pytest.approx( (10.0, 20.0) )
+  assert lines[1] == pytest.approx( (100.0, 30.0) )
+
+  with pytest.raises( ValueError ):
+    tiles.medianLines( [ ((0,0), None) ], 64, 64, 64, 64 )
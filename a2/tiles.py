@@ -0,0 +1,212 @@
+# Grid removal in overlapping tiles
+#
+# Instead of one FT of the whole page, the page is split into square
+# tiles that overlap their neighbours by 'overlap' pixels, and the
+# grid is removed from each tile separately with degrid.removeGrid().
+# The tiles are done in parallel on a pool of processes, with at most
+# a few tiles waiting for each process, so the memory used depends on
+# the tile size rather than the page size.
+#
+# Because each tile finds its own grid angles and spacing, a grid that
+# varies across the page (e.g. in a skewed or warped scan) is removed
+# better than with one FT.
+#
+# The results of the tiles are blended where they overlap: each tile
+# is weighted by a window that is 1 in its interior and falls smoothly
+# (as sin^2) towards its edges across the overlap, except at the edges
+# of the page.
+
+
+import math, io, time, contextlib, concurrent.futures
+
+import numpy as np
+
+import degrid
+
+
+# Remove the grid from 'image' in tiles of 'tileSize' x 'tileSize'
+# pixels that overlap by 'overlap' pixels, using 'numWorkers' processes.
+# The other parameters are passed to degrid.removeGrid() for each tile.
+#
+# Returns gridImage, resultImage, lines, tileLines and metrics.  'lines'
+# are the median over the tiles of each tile's lines, with the distances
+# scaled to the size of the whole image.  'tileLines' are the lines of
+# each tile, as a list of ((x0,y0), lines) with lines = None if the
+# tile's grid could not be found (in which case the tile is left as it
+# is).  'metrics' are as from degrid.removeGrid(), with the step times,
+# sizes and counts summed over the tiles (so the step times add up to
+# more than the total time when the tiles are done in parallel), and
+# the number of tiles.
+#
+# Raises ValueError if 'overlap' is not at least 0 and less than half
+# of 'tileSize' (so that only neighbouring tiles overlap), or if the
+# grid could not be found in any tile.
+
+def removeGridTiled( image, tileSize, overlap, numWorkers, usePeaks=True, threshold=0.4, cutoff=16, minRadius=6 ):
+
+  if not 0 <= overlap < tileSize/2:
+    raise ValueError( 'tile overlap of %s is not in [0,%s) for tiles of size %s' % (overlap, tileSize/2, tileSize) )
+
+  startTime = time.perf_counter()
+
+  height, width = image.shape
+
+  corners = [ (x0,y0) for y0 in tileStarts( height, tileSize, overlap )
+                      for x0 in tileStarts( width,  tileSize, overlap ) ]
+
+  print( 'removing grid in %d tiles of %dx%d' % (len(corners), min(tileSize,width), min(tileSize,height)) )
+
+  resultSum = np.zeros( (height,width), np.float32 ) # (float32, as from removeGrid())
+  gridSum   = np.zeros( (height,width), np.float32 )
+  weightSum = np.zeros( (height,width), np.float32 )
+
+  tileLines = []
+
+  metrics = degrid.newMetrics( height, width )
+  metrics['tiles'] = len(corners)
+
+  with concurrent.futures.ProcessPoolExecutor( numWorkers ) as pool:
+
+    pending  = {}
+    nextTile = 0
+
+    while nextTile < len(corners) or pending:
+
+      # keep at most two tiles waiting for each process
+
+      while nextTile < len(corners) and len(pending) < 2*numWorkers:
+        x0, y0 = corners[nextTile]
+        tile = np.real( image[y0:y0+tileSize,x0:x0+tileSize] )
+        pending[ pool.submit( removeTileGrid, tile, usePeaks, threshold, cutoff, minRadius ) ] = (x0,y0)
+        nextTile += 1
+
+      done, notDone = concurrent.futures.wait( pending, return_when=concurrent.futures.FIRST_COMPLETED )
+
+      for future in done:
+
+        x0, y0 = pending.pop( future )
+        tileGrid, tileResult, lines, tileMetrics = future.result()
+
+        if tileMetrics is not None:
+          degrid.addMetrics( metrics, tileMetrics )
+
+        th, tw = tileResult.shape
+        weights = np.outer( tileWeights( th, overlap, y0 > 0, y0+th < height ),
+                            tileWeights( tw, overlap, x0 > 0, x0+tw < width ) )
+
+        resultSum[y0:y0+th,x0:x0+tw] += weights * tileResult
+        gridSum[y0:y0+th,x0:x0+tw]   += weights * tileGrid
+        weightSum[y0:y0+th,x0:x0+tw] += weights
+
+        tileLines.append( ((x0,y0), lines) )
+
+  tileLines.sort( key=lambda item: (item[0][1], item[0][0]) )
+
+  lines = medianLines( tileLines, min(tileSize,width), min(tileSize,height), width, height )
+
+  degrid.finishMetrics( metrics, time.perf_counter() - startTime ) # (there are no stages, so this sets the total time)
+
+  return gridSum / weightSum, resultSum / weightSum, lines, tileLines, metrics
+
+
+# Starting positions of tiles of 'tileSize' that overlap by 'overlap'
+# and cover [0,length).  The last tile ends at 'length'.
+
+def tileStarts( length, tileSize, overlap ):
+
+  if length <= tileSize:
+    return [0]
+
+  step = tileSize - overlap
+
+  starts = list( range( 0, length-tileSize, step ) )
+  starts.append( length-tileSize )
+
+  return starts
+
+
+# Weights of a tile of 'length' pixels along one axis: 1, but falling
+# to near 0 across the first 'overlap' pixels if 'fadeStart' and across
+# the last 'overlap' pixels if 'fadeEnd'
+
+def tileWeights( length, overlap, fadeStart, fadeEnd ):
+
+  weights = np.ones( length )
+
+  ramp = np.sin( (np.arange( overlap ) + 0.5) / overlap * math.pi/2 ) ** 2
+  ramp = ramp[:length]
+
+  if fadeStart:
+    weights[:len(ramp)] *= ramp
+  if fadeEnd:
+    weights[length-len(ramp):] *= ramp[::-1]
+
+  return weights
+
+
+# Remove the grid from one tile.  This runs in a worker process.
+# Returns the smoothed grid image, the result, the lines and the
+# metrics, or the tile itself and None, None if no grid was found.
+
+def removeTileGrid( tile, usePeaks, threshold, cutoff, minRadius ):
+
+  try:
+    with contextlib.redirect_stdout( io.StringIO() ): # (removeGrid() prints its steps)
+      imageHalfFT, gridHalfFT, gridImage, resultImage, lines, metrics = degrid.removeGrid( tile, usePeaks, threshold, cutoff, minRadius )
+  except (ValueError, IndexError, ZeroDivisionError): # (no peaks in two directions)
+    return np.zeros( tile.shape ), tile, None, None
+
+  return np.real( gridImage ), np.real( resultImage ), lines, metrics
+
+
+# Combine the lines of the tiles into one [ (angle1,distance1),
+# (angle2,distance2) ] for the whole image.  The two lines of each tile
+# are matched, as a pair, to the two directions of the first tile (so
+# each tile adds one line to each direction), and the median angle and
+# distance (scaled to the image size) are taken for each.  Raises
+# ValueError if no tile has lines.
+
+def medianLines( tileLines, tileWidth, tileHeight, width, height ):
+
+  found = [ lines for corner, lines in tileLines if lines is not None ]
+
+  if not found:
+    raise ValueError( 'the grid was not found in any of the %d tiles' % len(tileLines) )
+
+  reference = [ angle for angle, distance in found[0] ]
+
+  angles    = [ [], [] ]
+  distances = [ [], [] ]
+
+  for lines in found:
+
+    # match the lines to the reference directions as they are or swapped
+
+    same    = sum( abs( (angle - r + 90) % 180 - 90 ) for (angle, distance), r in zip( lines, reference ) )
+    swapped = sum( abs( (angle - r + 90) % 180 - 90 ) for (angle, distance), r in zip( lines, reference[::-1] ) )
+
+    if swapped < same:
+      lines = lines[::-1]
+
+    for k, (angle, distance) in enumerate( lines ):
+      angles[k].append( reference[k] + (angle - reference[k] + 90) % 180 - 90 ) # (near the reference, so the median makes sense)
+      distances[k].append( scaleDistance( angle, distance, tileWidth, tileHeight, width, height ) )
+
+  return [ (float( np.median( angles[k] ) ) % 180, float( np.median( distances[k] ) )) for k in range(2) ]
+
+
+# Scale the distance of a grid line's FT peak, found in an image of
+# size fromWidth x fromHeight, to the size toWidth x toHeight.  The
+# peak at (u,v) moves to (u*toWidth/fromWidth,v*toHeight/fromHeight),
+# and its angle, which is that of (u,v*width/height), does not change.
+
+def scaleDistance( angle, distance, fromWidth, fromHeight, toWidth, toHeight ):
+
+  theta = angle * math.pi/180
+
+  u = math.cos(theta) * fromWidth  # proportional to u and v
+  v = math.sin(theta) * fromHeight
+
+  scale = distance / math.hypot( u, v )
+
+  return math.hypot( u*scale * toWidth/fromWidth, v*scale * toHeight/fromHeight )
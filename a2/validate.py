@@ -0,0 +1,61 @@
+# Check the array compute engine against the loop implementation
+#
+# Runs compute() with each engine on each image and reports the times
+# and the differences in 'lines' and in the result image.  The command
+# line is
+#
+#     validate.py [{image filename} ...]
+#
+# with the image files in the 'images' directory.  The default is
+# ecg-01.png and ecg-02.png.  The loop implementation takes a minute
+# or more on each of those.
+
+
+import sys, time, io, contextlib
+
+import numpy as np
+
+filenames = sys.argv[1:] if len(sys.argv) > 1 else [ 'ecg-01.png', 'ecg-02.png' ]
+
+import main
+
+
+# Run compute() on the image in 'path' with 'engine'.  Returns the
+# result image, the lines and the time taken.
+
+def runEngine( path, engine ):
+
+  main.image = main.loadImage( path )
+  main.imageFT = main.gridImage = main.gridImageFT = main.resultImage = None
+  main.computeEngine = engine
+
+  startTime = time.perf_counter()
+  with contextlib.redirect_stdout( io.StringIO() ): # (compute() prints its steps)
+    resultImage, lines = main.compute()
+  seconds = time.perf_counter() - startTime
+
+  return resultImage, lines, seconds
+
+
+allSame = True
+
+for filename in filenames:
+
+  path = main.os.path.join( main.imageDir, filename )
+
+  arrayResult, arrayLines, arraySeconds = runEngine( path, 'array' )
+  loopResult,  loopLines,  loopSeconds  = runEngine( path, 'loop' )
+
+  diff = np.absolute( arrayResult - loopResult )
+  linesDiff = np.absolute( np.array( arrayLines ) - np.array( loopLines ) ).max()
+
+  print( '%s: array %.2f s, loop %.1f s' % (filename, arraySeconds, loopSeconds) )
+  print( '  lines %s vs %s (max difference %g)' % (arrayLines, loopLines, linesDiff) )
+  print( '  result: %d of %d pixels differ (max difference %g)' % ((diff > 1e-9).sum(), diff.size, diff.max()) )
+
+  if linesDiff > 1e-9 or diff.max() > 1e-9:
+    allSame = False
+
+print( 'same results' if allSame else 'RESULTS DIFFER' )
+
+sys.exit( 0 if allSame else 1 )